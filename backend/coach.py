@@ -1,22 +1,63 @@
 """
 Core coaching logic — shared between the CLI tool and the web backend.
+
+Heavy dependencies are imported only when first needed so that offline and
+cached CLI commands start quickly: anthropic on the first API call, dotenv only
+if a .env file exists. The .env file is loaded on import, before any settings
+are read.
 """
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import math
 import os
+import re
+import statistics
+import struct
+import threading
+import time
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-
-import anthropic
-import yaml
+from typing import Generator, Iterator, Optional
 
 REPO_ROOT = Path(__file__).parent.parent
 STRATEGY_DIR = REPO_ROOT / "strategy"
 PROMPTS_DIR = REPO_ROOT / "prompts"
+CACHE_DIR = REPO_ROOT / ".cache"
+BUNDLE_FILE = CACHE_DIR / "strategy_bundle.json"
+BUNDLE_VERSION = 2
+
+
+def load_env() -> None:
+    """Load a .env file from the backend or repo root, if python-dotenv is installed."""
+    for parent in [Path(__file__).parent, REPO_ROOT]:
+        if (parent / ".env").exists():
+            try:
+                from dotenv import load_dotenv
+            except ImportError:
+                return  # dotenv optional; user can set env vars directly
+            load_dotenv(parent / ".env")
+            return
+
 
+# Settings below (and in the modules that import this one) are read from the
+# environment at import time, so .env is loaded first
+load_env()
 
-def load_strategy_context() -> str:
-    """Load all strategy YAML files into a single formatted context block."""
+DEFAULT_MODEL = "claude-sonnet-4-6"
+FAST_MODEL = os.environ.get("COACH_FAST_MODEL", "claude-haiku-4-5")
+AUTO_MODEL = "auto"
+
+logger = logging.getLogger("coach")
+
+
+def load_strategy_sections() -> list[str]:
+    """Load each strategy YAML file as a formatted section, most essential first."""
     if not STRATEGY_DIR.exists():
-        return ""
+        return []
 
     parts = []
     ordered_files = [
@@ -42,7 +83,7 @@ def load_strategy_context() -> str:
             title = yaml_file.stem.replace("_", " ").title()
             parts.append(f"### {title}\n\n```yaml\n{content}\n```")
 
-    return "\n\n---\n\n".join(parts)
+    return parts
 
 
 def load_system_prompt() -> str:
@@ -56,10 +97,53 @@ def load_system_prompt() -> str:
     )
 
 
-def build_full_system_prompt() -> str:
-    """Build the complete system prompt with embedded strategy knowledge."""
-    base = load_system_prompt()
-    strategy = load_strategy_context()
+# ── Strategy Bundle ────────────────────────────────────────────────────────────
+#
+# The system prompt and formatted strategy sections are cached in one JSON file,
+# rebuilt only when a source file's mtime changes.
+
+def _bundle_sources() -> dict:
+    sources = [PROMPTS_DIR / "coach_system.md"]
+    if STRATEGY_DIR.exists():
+        sources.extend(sorted(STRATEGY_DIR.glob("*.yaml")))
+    return {str(p): p.stat().st_mtime_ns for p in sources if p.exists()}
+
+
+def load_prompt_bundle() -> dict:
+    """Return {"base": ..., "strategy_sections": [...]}, from the bundle file when it is fresh."""
+    sources = _bundle_sources()
+    try:
+        bundle = json.loads(BUNDLE_FILE.read_text(encoding="utf-8"))
+        if bundle.get("version") == BUNDLE_VERSION and bundle.get("sources") == sources:
+            return bundle
+    except (OSError, ValueError):
+        pass
+
+    bundle = {
+        "version": BUNDLE_VERSION,
+        "sources": sources,
+        "base": load_system_prompt(),
+        "strategy_sections": load_strategy_sections(),
+    }
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp = BUNDLE_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(bundle), encoding="utf-8")
+        os.replace(tmp, BUNDLE_FILE)
+    except OSError:
+        pass  # read-only checkout; just rebuild next time
+    return bundle
+
+
+def build_full_system_prompt(include_strategy: bool = True, max_sections: Optional[int] = None) -> str:
+    """
+    Build the complete system prompt with embedded strategy knowledge.
+    max_sections keeps only the first N strategy files (see fit_system_prompt).
+    """
+    bundle = load_prompt_bundle()
+    base = bundle["base"]
+    sections = bundle["strategy_sections"] if include_strategy else []
+    strategy = "\n\n---\n\n".join(sections[:max_sections])
     if strategy:
         return (
             f"{base}\n\n---\n\n"
@@ -71,6 +155,57 @@ def build_full_system_prompt() -> str:
     return base
 
 
+# ── Strategy Thresholds ────────────────────────────────────────────────────────
+#
+# Numbers the routing heuristics and the similarity cache share with the
+# strategy files, read from the YAML so the two never disagree with it.
+
+@lru_cache(maxsize=1)
+def strategy_thresholds() -> dict:
+    """Thresholds read from the strategy YAML (defaults if a file or rule is missing)."""
+    thresholds = {
+        "early_civil_actions": 5,   # age_guide: "Acquire 5th Civil Action"
+        "civil_actions": 6,         # card_priority: "fewer than 6 Civil Actions"
+        "military_actions": 3,
+        "science": 3,
+        "culture": 5,
+        "max_gap": 2,               # military: max_acceptable_gap
+    }
+    try:
+        import yaml
+    except ImportError:
+        return thresholds
+
+    def load(name: str) -> dict:
+        path = STRATEGY_DIR / name
+        return yaml.safe_load(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    def set_from(key: str, pattern: str, text) -> None:
+        match = re.search(pattern, text or "", re.IGNORECASE)
+        if match:
+            thresholds[key] = int(match.group(1))
+
+    try:
+        military = load("military.yaml").get("military_strategy", {})
+        gap = military.get("core_principle", {}).get("target_differential", {}).get("max_acceptable_gap")
+        if isinstance(gap, int):
+            thresholds["max_gap"] = gap
+
+        cards = load("card_priority.yaml").get("card_draft_priority", {})
+        tier_1, tier_2 = cards.get("tier_1", {}), cards.get("tier_2", {})
+        set_from("civil_actions", r"fewer than (\d+) Civil Actions", tier_1.get("civil_actions", {}).get("condition"))
+        set_from("military_actions", r"fewer than (\d+) Military Actions", tier_1.get("military_actions", {}).get("condition"))
+        set_from("science", r"fewer than (\d+) science", tier_1.get("science_buildings", {}).get("condition"))
+        set_from("culture", r"below (\d+) per turn", tier_2.get("culture_engines", {}).get("condition"))
+
+        for priority in load("age_guide.yaml").get("age_guide", {}).get("age_i", {}).get("priorities", []):
+            set_from("early_civil_actions", r"Acquire (\d+)(?:st|nd|rd|th) Civil Action", priority.get("action"))
+    except (OSError, AttributeError, yaml.YAMLError) as e:
+        logger.warning("could not read strategy thresholds, using defaults: %s", e)
+
+    return thresholds
+
+
 def format_game_state(state: dict) -> str:
     """Convert a game state dict to a readable text block for the prompt."""
     lines = []
@@ -131,11 +266,15 @@ def format_game_state(state: dict) -> str:
             if isinstance(opp_mil, (int, float)) and isinstance(player_mil, (int, float)):
                 gap = opp_mil - player_mil
                 gap_str = f"  [GAP: +{gap}]" if gap > 0 else (f"  [GAP: {gap}]" if gap < 0 else "  [TIED]")
-            lines.append(
+            opp_line = (
                 f"  Opponent {i}: Military {opp_mil}{gap_str}  |  "
                 f"~{opp.get('culture_production_estimate', '?')} culture/turn  |  "
                 f"~{opp.get('culture_points_estimate', '?')} pts"
             )
+            note = opp.get("_note") or opp.get("notes")
+            if note:
+                opp_line += f"  [{note}]"
+            lines.append(opp_line)
 
     card_row = state.get("card_row", {})
     available_cards = []
@@ -152,6 +291,32 @@ def format_game_state(state: dict) -> str:
     return "\n".join(lines)
 
 
+def compute_military_summary(state: dict) -> Optional[str]:
+    """Generate a quick military situation summary for context."""
+    player = state.get("player", {})
+    opponents = state.get("opponents", [])
+    player_mil = player.get("military_strength")
+
+    if not isinstance(player_mil, (int, float)) or not opponents:
+        return None
+
+    opp_strengths = [
+        o.get("military_strength")
+        for o in opponents
+        if isinstance(o.get("military_strength"), (int, float))
+    ]
+    if not opp_strengths:
+        return None
+
+    gap = max(opp_strengths) - player_mil
+    if gap > 2:
+        return f"!! MILITARY WARNING: Gap of {gap} vs strongest opponent (threshold is 2)"
+    elif gap > 0:
+        return f"Military gap: {gap} vs strongest opponent (within safe threshold)"
+    else:
+        return "Military: you are leading or tied with all opponents"
+
+
 def build_suggest_prompt(game_state_text: str) -> str:
     return f"""Here is the current game state:
 
@@ -165,7 +330,8 @@ For each move:
 2. Explain why it is the right move given the current numbers
 3. Note any trade-offs or conditions that could change the recommendation
 
-Then provide one overall strategic insight about my current game state."""
+Then provide one overall strategic insight about my current game state —
+what is my biggest structural advantage or risk right now?"""
 
 
 def build_evaluate_prompt(game_state_text: str, proposed_move: str) -> str:
@@ -183,17 +349,583 @@ Please evaluate this move with:
 5. One specific action or situation to watch for next turn"""
 
 
-def call_claude(system_prompt: str, user_message: str, model: str = "claude-sonnet-4-6") -> str:
-    """Call the Claude API and return the text response."""
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise ValueError("ANTHROPIC_API_KEY environment variable is not set.")
+# ── Token Accounting ───────────────────────────────────────────────────────────
+#
+# Request sizes are estimated locally before each call (no round trip to the
+# token-counting endpoint). The estimates size the scheduler's token bucket and
+# trim optional context; token_stats() compares them with the usage the API
+# reports.
+
+def _budgets(defaults: dict, env_prefix: str) -> dict:
+    return {
+        request_type: int(os.environ.get(f"{env_prefix}{request_type.upper()}", default))
+        for request_type, default in defaults.items()
+    }
+
+
+# max_tokens per request type: a suggestion covers three moves plus an insight,
+# and a screenshot parse is a full JSON game state. Evaluations keep the
+# original 1500 until the truncated counts in token_stats() show a lower cap
+# is safe
+OUTPUT_BUDGETS = _budgets({
+    "suggest": 1500,
+    "evaluate": 1500,
+    "parse_game_state": 1200,
+    "parse_progression_graph": 2000,
+}, "COACH_OUTPUT_BUDGET_")
+
+# Input budgets for coaching requests: strategy files are dropped from the
+# system prompt, least essential first, until the request fits
+INPUT_BUDGETS = _budgets({"suggest": 12000, "evaluate": 12000}, "COACH_INPUT_BUDGET_")
+
+# Images are downscaled to fit these limits, then cost about w*h/750 tokens
+IMAGE_MAX_EDGE = 1568
+IMAGE_MAX_PIXELS = 1_150_000
+IMAGE_MAX_TOKENS = 1600
+
+_token_stats = {}
+_token_lock = threading.Lock()
+
+
+def _token_entry(request_type: str) -> dict:
+    return _token_stats.setdefault(request_type, {
+        "requests": 0, "trimmed": 0, "truncated": 0,
+        "estimated_input": 0, "input_tokens": 0, "output_tokens": 0,
+    })
+
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count: one per word or symbol, or one per four
+    characters for text full of long identifiers, whichever is larger.
+    """
+    return max(len(_TOKEN_PIECES.findall(text)), len(text) // 4)
+
+
+# System prompts are few and large; estimate each one once
+_system_prompt_tokens = lru_cache(maxsize=16)(estimate_tokens)
+
+
+def image_size(data: bytes) -> Optional[tuple[int, int]]:
+    """(width, height) read from a PNG, GIF or JPEG header, or None."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 <= len(data) and data[i] == 0xFF:
+            marker = data[i + 1]
+            # Start-of-frame markers carry the size (C4, C8 and CC are not frames)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def estimate_image_tokens(image_base64: str) -> int:
+    """Tokens for a base64 image after the API's downscaling; the maximum if the size is unknown."""
+    try:
+        # The header is near the start; 64K base64 characters cover JPEG metadata
+        size = image_size(base64.b64decode(image_base64[:65536]))
+    except (binascii.Error, ValueError, struct.error):
+        size = None
+    if not size or not all(size):
+        return IMAGE_MAX_TOKENS
+
+    width, height = size
+    scale = min(1.0, IMAGE_MAX_EDGE / max(width, height), math.sqrt(IMAGE_MAX_PIXELS / (width * height)))
+    return min(IMAGE_MAX_TOKENS, math.ceil(width * height * scale * scale / 750))
+
+
+def estimate_input_tokens(system: str, messages: list) -> int:
+    """Estimated input tokens of a messages.create() call, images included."""
+    tokens = _system_prompt_tokens(system) if system else 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += estimate_tokens(content)
+            continue
+        for block in content:
+            if block["type"] == "image":
+                tokens += estimate_image_tokens(block["source"]["data"])
+            elif block["type"] == "text":
+                tokens += estimate_tokens(block["text"])
+    return tokens
+
+
+@lru_cache(maxsize=2)
+def _system_prompt_variants(include_strategy: bool) -> list[tuple[str, int]]:
+    """(prompt, estimated tokens) with every strategy file, then one fewer, down to none."""
+    count = len(load_prompt_bundle()["strategy_sections"]) if include_strategy else 0
+    variants = []
+    for kept in range(count, -1, -1):
+        prompt = build_full_system_prompt(include_strategy, max_sections=kept)
+        variants.append((prompt, _system_prompt_tokens(prompt)))
+    return variants
+
+
+def fit_system_prompt(request_type: str, user_message: str, include_strategy: bool = True) -> str:
+    """
+    The system prompt for a request: as much of the strategy knowledge base as
+    fits INPUT_BUDGETS[request_type] alongside the user message.
+    """
+    variants = _system_prompt_variants(include_strategy)
+    budget = INPUT_BUDGETS.get(request_type)
+    if budget is None:
+        return variants[0][0]
+
+    available = budget - estimate_tokens(user_message)
+    dropped = next((i for i, (_, tokens) in enumerate(variants) if tokens <= available), len(variants) - 1)
+    if dropped:
+        with _token_lock:
+            _token_entry(request_type)["trimmed"] += 1
+        logger.debug("dropped %d strategy file(s) to fit the %s input budget of %d", dropped, request_type, budget)
+    return variants[dropped][0]
+
+
+def _record_tokens(request_type: str, estimated_input: int, request: dict, message) -> None:
+    usage = message.usage
+    truncated = message.stop_reason == "max_tokens"
+    with _token_lock:
+        entry = _token_entry(request_type)
+        entry["requests"] += 1
+        entry["truncated"] += truncated
+        entry["estimated_input"] += estimated_input
+        entry["input_tokens"] += usage.input_tokens
+        entry["output_tokens"] += usage.output_tokens
+    logger.info(
+        "tokens type=%s model=%s input=%d estimated=%d output=%d/%d stop=%s",
+        request_type, request.get("model"), usage.input_tokens, estimated_input,
+        usage.output_tokens, request["max_tokens"], message.stop_reason,
+    )
+    if truncated:
+        logger.warning(
+            "%s answer truncated at max_tokens=%d; raise COACH_OUTPUT_BUDGET_%s",
+            request_type, request["max_tokens"], request_type.upper(),
+        )
+
 
-    client = anthropic.Anthropic(api_key=api_key)
-    message = client.messages.create(
+def token_stats() -> dict:
+    """Per request type: budgets, average usage, estimate accuracy, trims and truncations."""
+    with _token_lock:
+        entries = {request_type: dict(entry) for request_type, entry in _token_stats.items()}
+
+    stats = {}
+    for request_type in sorted(set(OUTPUT_BUDGETS) | set(entries)):
+        entry = entries.get(request_type) or {}
+        requests = entry.get("requests", 0)
+        estimated = entry.get("estimated_input", 0)
+        stats[request_type] = {
+            "input_budget": INPUT_BUDGETS.get(request_type),
+            "output_budget": OUTPUT_BUDGETS.get(request_type),
+            "requests": requests,
+            "avg_input_tokens": entry["input_tokens"] / requests if requests else None,
+            "avg_output_tokens": entry["output_tokens"] / requests if requests else None,
+            # Actual / estimated input tokens; above 1 means the estimator runs low
+            "estimate_ratio": entry["input_tokens"] / estimated if estimated else None,
+            "truncated": entry.get("truncated", 0),
+            "trimmed_prompts": entry.get("trimmed", 0),
+        }
+    return stats
+
+
+class MissingAPIKeyError(ValueError):
+    """ANTHROPIC_API_KEY is not set."""
+
+
+_client = None
+_client_options = {}
+
+
+def configure_client(**options):
+    """Set extra anthropic.Anthropic options (e.g. max_retries) for the shared client.
+
+    The backend passes max_retries=0 so its scheduler owns 429/5xx retries and
+    backoff; the standalone CLI keeps the SDK defaults.
+    """
+    global _client
+    _client_options.update(options)
+    _client = None
+
+
+def get_client():
+    """Return a shared Anthropic client so its connection pool stays warm between calls."""
+    global _client
+    if _client is None:
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise MissingAPIKeyError("ANTHROPIC_API_KEY environment variable is not set.")
+        import anthropic
+        _client = anthropic.Anthropic(api_key=api_key, **_client_options)
+    return _client
+
+
+class CallCancelled(Exception):
+    """The caller gave up on a Claude call before it finished."""
+
+
+_cancel_stats = {"cancelled": 0, "wasted_generation_s": 0.0}
+_cancel_lock = threading.Lock()
+
+
+def create_message_text(cancel: Optional[threading.Event] = None, request_type: str = "other", **kwargs) -> str:
+    """
+    messages.create() returning the response text. With a cancel event the
+    response is streamed, and setting the event aborts the upstream request
+    at the next chunk (raising CallCancelled) instead of waiting it out.
+    Token usage is recorded under request_type (see token_stats).
+    """
+    client = get_client()
+    estimated_input = estimate_input_tokens(kwargs.get("system", ""), kwargs["messages"])
+    if cancel is None:
+        message = client.messages.create(**kwargs)
+        _record_tokens(request_type, estimated_input, kwargs, message)
+        return message.content[0].text
+
+    if cancel.is_set():
+        raise CallCancelled()
+    started = time.perf_counter()
+    parts = []
+    cancelled = False
+    with client.messages.stream(**kwargs) as stream:
+        for text in stream.text_stream:
+            if cancel.is_set():
+                cancelled = True
+                break  # leaving the with-block closes the HTTP response
+            parts.append(text)
+        else:
+            _record_tokens(request_type, estimated_input, kwargs, stream.get_final_message())
+
+    # A cancel that arrives after the last chunk is too late to save anything;
+    # the finished answer is returned (and cached) as usual
+    if cancelled:
+        wasted = time.perf_counter() - started
+        with _cancel_lock:
+            _cancel_stats["cancelled"] += 1
+            _cancel_stats["wasted_generation_s"] += wasted
+        logger.info("cancelled model=%s after %.2fs of generation", kwargs.get("model"), wasted)
+        raise CallCancelled()
+    return "".join(parts)
+
+
+def cancel_stats() -> dict:
+    with _cancel_lock:
+        return dict(_cancel_stats)
+
+
+def call_claude(
+    system_prompt: str,
+    user_message: str,
+    model: str = DEFAULT_MODEL,
+    cancel: Optional[threading.Event] = None,
+    request_type: str = "suggest",
+    max_tokens: Optional[int] = None,
+) -> str:
+    """Call the Claude API and return the text response (max_tokens defaults to the type's budget)."""
+    return create_message_text(
+        cancel,
+        request_type,
         model=model,
-        max_tokens=1500,
+        max_tokens=max_tokens or OUTPUT_BUDGETS[request_type],
         system=system_prompt,
         messages=[{"role": "user", "content": user_message}],
     )
-    return message.content[0].text
+
+
+def stream_claude(
+    system_prompt: str,
+    user_message: str,
+    model: str = DEFAULT_MODEL,
+    request_type: str = "suggest",
+    max_tokens: Optional[int] = None,
+) -> Iterator[str]:
+    """Call the Claude API and yield the response text as it is generated."""
+    request = {
+        "model": model,
+        "max_tokens": max_tokens or OUTPUT_BUDGETS[request_type],
+        "system": system_prompt,
+        "messages": [{"role": "user", "content": user_message}],
+    }
+    estimated_input = estimate_input_tokens(system_prompt, request["messages"])
+    with get_client().messages.stream(**request) as stream:
+        yield from stream.text_stream
+        _record_tokens(request_type, estimated_input, request, stream.get_final_message())
+
+
+# ── Answer Cache ───────────────────────────────────────────────────────────────
+
+def answer_cache_key(system_prompt: str, user_message: str, model: str) -> str:
+    """Key for the shared answer cache (see store.py)."""
+    digest = hashlib.sha256()
+    for part in (model, system_prompt, user_message):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# ── Model Routing ──────────────────────────────────────────────────────────────
+#
+# Easy states (an obvious heuristic answer exists) go to FAST_MODEL first. The
+# fast answer is kept only if its self-reported confidence is high and, for
+# suggestions, the top two candidate moves are clearly separated; otherwise we
+# escalate to DEFAULT_MODEL. An evaluation scores a single move, so it is gated
+# on confidence alone. States with no obvious answer skip the fast tier entirely.
+
+ROUTER_MIN_CONFIDENCE = float(os.environ.get("COACH_ROUTER_MIN_CONFIDENCE", "0.75"))
+ROUTER_MIN_MARGIN = float(os.environ.get("COACH_ROUTER_MIN_MARGIN", "2"))
+
+CA_CARDS = {"Code of Laws", "Aristocracy", "Philosophy", "Printing Press"}
+SCIENCE_CARDS = {"Library", "Alchemy", "Observatory"}
+MILITARY_FIX_CARDS = {"Tactics", "Swordsmen", "Knights", "Chivalry"}
+
+ROUTING_SUFFIXES = {
+    "suggest": """
+
+After your answer, add one final line in exactly this form (no other text on it):
+ROUTING: confidence=<0.0-1.0> top_scores=<score of best move>,<score of second-best move>
+Scores are out of 10. confidence is how sure you are that the best move is correct.""",
+    "evaluate": """
+
+After your answer, add one final line in exactly this form (no other text on it):
+ROUTING: confidence=<0.0-1.0> score=<the score you gave the proposed move>
+The score is out of 10. confidence is how sure you are that the score is right.""",
+}
+# Output allowance for the ROUTING line on top of the answer's budget
+ROUTING_LINE_TOKENS = 40
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_ROUTING_LINES = {
+    "suggest": re.compile(
+        rf"^\s*ROUTING:\s*confidence={_NUMBER}\s+top_scores={_NUMBER}\s*,\s*{_NUMBER}\s*$", re.MULTILINE,
+    ),
+    "evaluate": re.compile(rf"^\s*ROUTING:\s*confidence={_NUMBER}\s+score={_NUMBER}\s*$", re.MULTILINE),
+}
+
+_router_stats = {
+    "fast_only": 0,
+    "escalated": 0,
+    "direct": 0,
+    "fast_latency": deque(maxlen=200),
+    "large_latency": deque(maxlen=200),
+}
+
+
+def _row_cards(state: dict) -> set:
+    card_row = state.get("card_row", {})
+    cards = set()
+    for age_key in ["age_1_cards", "age_2_cards", "age_3_cards"]:
+        cards.update(card_row.get(age_key, []))
+    return cards
+
+
+def classify_state(state: dict) -> Optional[str]:
+    """
+    Return a short reason if the state has an obvious heuristic answer,
+    or None if it needs the larger model from the start.
+    """
+    thresholds = strategy_thresholds()
+    player = state.get("player", {})
+    row = _row_cards(state)
+
+    player_mil = player.get("military_strength")
+    opp_strengths = [
+        o.get("military_strength")
+        for o in state.get("opponents", [])
+        if isinstance(o.get("military_strength"), (int, float))
+    ]
+    if isinstance(player_mil, (int, float)) and opp_strengths:
+        gap = max(opp_strengths) - player_mil
+        if gap > thresholds["max_gap"]:
+            # Military danger outranks every other heuristic: the state is
+            # only easy if the obvious move is to close the gap
+            if row & MILITARY_FIX_CARDS:
+                return f"military gap {gap} with {', '.join(sorted(row & MILITARY_FIX_CARDS))} in the row"
+            return None
+
+    civil_actions = player.get("civil_actions")
+    if isinstance(civil_actions, int) and civil_actions < thresholds["civil_actions"] and row & CA_CARDS:
+        return f"{civil_actions} CA with {', '.join(sorted(row & CA_CARDS))} in the row"
+
+    science = player.get("science_production")
+    if isinstance(science, int) and science < thresholds["science"] and row & SCIENCE_CARDS:
+        return f"{science} science with {', '.join(sorted(row & SCIENCE_CARDS))} in the row"
+
+    return None
+
+
+def parse_routing_line(text: str, request_type: str = "suggest") -> tuple[str, Optional[float], Optional[float]]:
+    """
+    Strip the ROUTING line from a response; return (advice, confidence, margin).
+    A missing or malformed line gives (text, None, None), which escalates.
+    Evaluations have no margin (None).
+    """
+    match = _ROUTING_LINES[request_type].search(text)
+    if not match:
+        return text.strip(), None, None
+    advice = (text[:match.start()] + text[match.end():]).strip()
+    confidence = float(match.group(1))
+    margin = abs(float(match.group(2)) - float(match.group(3))) if request_type == "suggest" else None
+    return advice, confidence, margin
+
+
+def _fast_answer_ok(confidence: Optional[float], margin: Optional[float], request_type: str) -> bool:
+    if confidence is None or confidence < ROUTER_MIN_CONFIDENCE:
+        return False
+    return request_type != "suggest" or margin >= ROUTER_MIN_MARGIN
+
+
+def _record_direct(latency: float) -> None:
+    _router_stats["large_latency"].append(latency)
+    _router_stats["direct"] += 1
+    logger.info("router decision=direct model=%s latency=%.2fs", DEFAULT_MODEL, latency)
+
+
+def _record_fast(reason: str, confidence: float, margin: Optional[float], latency: float) -> None:
+    _router_stats["fast_latency"].append(latency)
+    _router_stats["fast_only"] += 1
+    logger.info(
+        "router decision=fast model=%s reason=%r confidence=%.2f margin=%s latency=%.2fs",
+        FAST_MODEL, reason, confidence, margin, latency,
+    )
+
+
+def _record_escalation(reason: str, confidence, margin, fast_latency: float, large_latency: float) -> None:
+    _router_stats["fast_latency"].append(fast_latency)
+    _router_stats["large_latency"].append(large_latency)
+    _router_stats["escalated"] += 1
+    logger.info(
+        "router decision=escalate model=%s reason=%r confidence=%s margin=%s latency=%.2fs+%.2fs",
+        DEFAULT_MODEL, reason, confidence, margin, fast_latency, large_latency,
+    )
+
+
+def plan_route(
+    system_prompt: str,
+    user_message: str,
+    state: dict,
+    request_type: str = "suggest",
+) -> Generator[tuple[str, str, Optional[int]], tuple[str, float], tuple[str, str]]:
+    """
+    The routing decision, independent of how calls are made. Yields
+    (model, user message, max_tokens or None for the default) for each upstream
+    call, is sent back (response text, latency), and returns (advice, model used).
+    """
+    reason = classify_state(state)
+    if reason is None:
+        advice, latency = yield DEFAULT_MODEL, user_message, None
+        _record_direct(latency)
+        return advice, DEFAULT_MODEL
+
+    raw, fast_latency = yield (
+        FAST_MODEL,
+        user_message + ROUTING_SUFFIXES[request_type],
+        OUTPUT_BUDGETS[request_type] + ROUTING_LINE_TOKENS,
+    )
+    advice, confidence, margin = parse_routing_line(raw, request_type)
+
+    if _fast_answer_ok(confidence, margin, request_type):
+        _record_fast(reason, confidence, margin, fast_latency)
+        return advice, FAST_MODEL
+
+    advice, large_latency = yield DEFAULT_MODEL, user_message, None
+    _record_escalation(reason, confidence, margin, fast_latency, large_latency)
+    return advice, DEFAULT_MODEL
+
+
+def route_claude(
+    system_prompt: str,
+    user_message: str,
+    state: dict,
+    cancel: Optional[threading.Event] = None,
+    request_type: str = "suggest",
+) -> tuple[str, str]:
+    """
+    Answer with the cheapest model that is confident enough.
+    Returns (advice, model actually used).
+    """
+    route = plan_route(system_prompt, user_message, state, request_type)
+    try:
+        model, message, max_tokens = next(route)
+        while True:
+            started = time.perf_counter()
+            text = call_claude(system_prompt, message, model, cancel, request_type, max_tokens)
+            model, message, max_tokens = route.send((text, time.perf_counter() - started))
+    except StopIteration as done:
+        return done.value
+
+
+def stream_routed(system_prompt: str, user_message: str, state: dict, request_type: str = "suggest") -> Iterator[str]:
+    """
+    Streaming version of route_claude. The fast answer is streamed line by line
+    with its ROUTING line held back; if it is not confident enough, a notice is
+    yielded and the larger model's answer follows.
+    """
+    reason = classify_state(state)
+    if reason is None:
+        started = time.perf_counter()
+        yield from stream_claude(system_prompt, user_message, DEFAULT_MODEL, request_type)
+        _record_direct(time.perf_counter() - started)
+        return
+
+    started = time.perf_counter()
+    pending = ""
+    routing_line = ""
+    fast_budget = OUTPUT_BUDGETS[request_type] + ROUTING_LINE_TOKENS
+    fast_message = user_message + ROUTING_SUFFIXES[request_type]
+    for chunk in stream_claude(system_prompt, fast_message, FAST_MODEL, request_type, fast_budget):
+        pending += chunk
+        while "\n" in pending:
+            line, pending = pending.split("\n", 1)
+            if line.strip().startswith("ROUTING:"):
+                routing_line = line
+            else:
+                yield line + "\n"
+    if pending.strip().startswith("ROUTING:"):
+        routing_line = pending
+    elif pending:
+        yield pending
+    fast_latency = time.perf_counter() - started
+    _, confidence, margin = parse_routing_line(routing_line, request_type)
+
+    if _fast_answer_ok(confidence, margin, request_type):
+        _record_fast(reason, confidence, margin, fast_latency)
+        return
+
+    yield f"\n\n[Low confidence from {FAST_MODEL} — asking {DEFAULT_MODEL}]\n\n"
+    started = time.perf_counter()
+    yield from stream_claude(system_prompt, user_message, DEFAULT_MODEL, request_type)
+    _record_escalation(reason, confidence, margin, fast_latency, time.perf_counter() - started)
+
+
+def router_stats() -> dict:
+    """Routing counts, median latencies and estimated time saved by the fast tier."""
+    fast = list(_router_stats["fast_latency"])
+    large = list(_router_stats["large_latency"])
+    median_fast = statistics.median(fast) if fast else None
+    median_large = statistics.median(large) if large else None
+
+    saved = None
+    if median_fast is not None and median_large is not None:
+        # Each escalation also paid for a wasted fast call
+        saved = (
+            _router_stats["fast_only"] * (median_large - median_fast)
+            - _router_stats["escalated"] * median_fast
+        )
+
+    return {
+        "fast_model": FAST_MODEL,
+        "large_model": DEFAULT_MODEL,
+        "min_confidence": ROUTER_MIN_CONFIDENCE,
+        "min_margin": ROUTER_MIN_MARGIN,
+        "fast_only": _router_stats["fast_only"],
+        "escalated": _router_stats["escalated"],
+        "direct": _router_stats["direct"],
+        "median_fast_latency_s": median_fast,
+        "median_large_latency_s": median_large,
+        "estimated_seconds_saved": saved,
+    }
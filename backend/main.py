@@ -1,32 +1,48 @@
 """
 Through the Ages Coaching API
 Run from the backend/ directory: uvicorn main:app --reload --port 8000
+
+Multi-worker: COACH_WORKERS=4 uvicorn main:app --workers 4 --port 8000
+Workers share cached answers, sessions and in-flight requests through the
+SQLite store in .cache/coach.db (see store.py), and split the API rate limits.
 """
 from pathlib import Path
-from typing import Optional, List
-
-# Load .env before anything else
-try:
-    from dotenv import load_dotenv
-    for parent in [Path(__file__).parent, Path(__file__).parent.parent]:
-        if (parent / ".env").exists():
-            load_dotenv(parent / ".env")
-            break
-except ImportError:
-    pass
+from typing import Dict, Optional, List, Literal
+
+# Importing the coaching core loads .env, so it comes before anything that
+# reads settings from the environment
+import coach
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+import asyncio
+import hashlib
 import json
+import logging
 import os
-import anthropic
+import random
+import threading
+import time
+
+from coach import (
+    AUTO_MODEL, OUTPUT_BUDGETS, answer_cache_key, format_game_state, load_prompt_bundle,
+    build_suggest_prompt, build_evaluate_prompt, call_claude, cancel_stats, create_message_text,
+    estimate_input_tokens, fit_system_prompt, plan_route, router_stats, token_stats,
+)
+from scheduler import BACKGROUND, INTERACTIVE, is_rate_limit_error, scheduler_from_env
+from similarity import SIMILARITY_TOLERANCE, advice_agrees, nearest, state_features, state_signature
+from store import Store
 
-from coach import build_full_system_prompt, format_game_state, build_suggest_prompt, build_evaluate_prompt, call_claude
+logging.basicConfig(level=os.environ.get("COACH_LOG_LEVEL", "INFO"))
 
 REPO_ROOT = Path(__file__).parent.parent
 PROMPTS_DIR = REPO_ROOT / "prompts"
+SCREENSHOT_PROMPTS = {
+    "game_state": "parse_screenshot.md",
+    "progression_graph": "parse_progression_graph.md",
+}
 
 
 # ── App Setup ──────────────────────────────────────────────────────────────────
@@ -41,13 +57,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load strategy + system prompt once at startup (not on every request)
-_system_prompt: str = ""
+# All Claude calls go through one scheduler so interactive requests are never
+# starved by background jobs sharing the same rate limits
+_scheduler = scheduler_from_env()
+# SDK-level retries would bypass the scheduler's backoff, priorities and metrics
+coach.configure_client(max_retries=0)
+PRIORITIES = {"interactive": INTERACTIVE, "background": BACKGROUND}
+
+# Shared across worker processes: answer cache, sessions, in-flight claims
+_store = Store()
+_cache_stats = {"hits": 0, "similar_hits": 0, "misses": 0, "dedup_waits": 0}
+# Fraction of similar-state hits re-generated in the background to measure accuracy
+SIMILARITY_AUDIT_RATE = float(os.environ.get("COACH_SIMILARITY_AUDIT_RATE", "0.05"))
+# The event loop only keeps weak references to tasks; hold audits until they finish
+_audit_tasks: set = set()
+_abandoned = {"disconnected": 0, "superseded": 0}
+
+logger = logging.getLogger("coach.api")
 
 @app.on_event("startup")
 async def startup():
-    global _system_prompt
-    _system_prompt = build_full_system_prompt()
+    # Build the per-request system prompt variants once, not on the first request
+    fit_system_prompt("suggest", "")
 
 
 # ── Pydantic Models ────────────────────────────────────────────────────────────
@@ -101,13 +132,17 @@ class GameState(BaseModel):
 
 class SuggestMovesRequest(BaseModel):
     game_state: GameState
-    model: str = "claude-sonnet-4-6"
+    model: str = AUTO_MODEL  # "auto" routes easy states to the fast model first
+    priority: Literal["interactive", "background"] = "interactive"
+    session_id: Optional[str] = None
 
 
 class EvaluateMoveRequest(BaseModel):
     game_state: GameState
     proposed_move: str
-    model: str = "claude-sonnet-4-6"
+    model: str = AUTO_MODEL
+    priority: Literal["interactive", "background"] = "interactive"
+    session_id: Optional[str] = None
 
 
 class CoachResponse(BaseModel):
@@ -118,10 +153,26 @@ class CoachResponse(BaseModel):
 class ParseScreenshotRequest(BaseModel):
     image_base64: str
     media_type: str = "image/png"
+    kind: Literal["game_state", "progression_graph"] = "game_state"
+    session_id: Optional[str] = None
+    priority: Literal["interactive", "background"] = "interactive"
+
+
+class GraphSeries(BaseModel):
+    color: Optional[str] = None
+    values: List[float] = []
+
+
+class ProgressionGraph(BaseModel):
+    category: str = "unknown"
+    rounds: Optional[int] = None
+    series: Dict[str, GraphSeries] = {}
 
 
 class ParseScreenshotResponse(BaseModel):
-    game_state: dict
+    # Exactly one is set, matching the request's kind
+    game_state: Optional[dict] = None
+    progression_graph: Optional[ProgressionGraph] = None
     notes: str
 
 
@@ -131,74 +182,316 @@ class ParseScreenshotResponse(BaseModel):
 async def health():
     return {
         "status": "ok",
-        "strategy_loaded": len(_system_prompt) > 500,
+        "strategy_loaded": bool(load_prompt_bundle()["strategy_sections"]),
     }
 
 
+@app.get("/api/metrics")
+async def metrics():
+    hit_stats = await _db(_store.similar_hit_stats)
+    store_stats = await _db(_store.stats)
+    return {
+        "worker_pid": os.getpid(),
+        "router": router_stats(),
+        "scheduler": _scheduler.stats(),
+        "cache": {
+            **_cache_stats,
+            "similarity": {"tolerance": SIMILARITY_TOLERANCE, **hit_stats},
+            "store": store_stats,
+        },
+        "cancellations": {**_abandoned, **cancel_stats()},
+        "tokens": token_stats(),
+    }
+
+
+@app.get("/api/session/{session_id}")
+async def get_session(session_id: str):
+    state = await _db(_store.get_session, session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"session_id": session_id, "game_state": state}
+
+
+async def _ask_claude(
+    system_prompt: str,
+    user_message: str,
+    state_dict: dict,
+    model: str,
+    request_type: str,
+    priority: int,
+    cancel: Optional[threading.Event],
+) -> tuple[str, str]:
+    """
+    Call Claude with the requested model, or let the router pick for "auto".
+    Each upstream call (a routed request may make two) waits for its own
+    scheduler slot, is charged its own tokens and is retried on its own.
+    """
+    def timed_call(call_model: str, message: str, max_tokens: Optional[int]) -> tuple[str, float]:
+        started = time.perf_counter()
+        text = call_claude(system_prompt, message, call_model, cancel, request_type, max_tokens)
+        return text, time.perf_counter() - started
+
+    async def scheduled_call(call_model: str, message: str, max_tokens: Optional[int]) -> tuple[str, float]:
+        est_tokens = (
+            estimate_input_tokens(system_prompt, [{"role": "user", "content": message}])
+            + (max_tokens or OUTPUT_BUDGETS[request_type])
+        )
+        return await _scheduler.run(
+            timed_call, call_model, message, max_tokens, priority=priority, est_tokens=est_tokens,
+        )
+
+    if model != AUTO_MODEL:
+        text, _ = await scheduled_call(model, user_message, None)
+        return text, model
+
+    route = plan_route(system_prompt, user_message, state_dict, request_type)
+    try:
+        step = next(route)
+        while True:
+            step = route.send(await scheduled_call(*step))
+    except StopIteration as done:
+        return done.value
+
+
+async def _db(method, *args):
+    """
+    Run a blocking store call in a worker thread. SQLite may wait up to its
+    busy timeout for another worker's write lock, which must not stall the loop.
+    """
+    return await asyncio.to_thread(method, *args)
+
+
+def _api_error(e: Exception) -> HTTPException:
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=500, detail=str(e))
+    if is_rate_limit_error(e):
+        return HTTPException(status_code=429, detail="Claude API rate limit reached; try again shortly.")
+    return HTTPException(status_code=502, detail=f"Claude API error: {str(e)}")
+
+
+async def _run_until_abandoned(request: Request, slot: Optional[str], request_key: str, work):
+    """
+    Run work(cancel) while watching for the client to disconnect or for a newer,
+    different request in the same session slot. Either one aborts the upstream
+    Claude call instead of letting it generate a response nobody will read.
+    """
+    if slot:
+        await _db(_store.set_latest_request, slot, request_key)
+
+    cancel = threading.Event()
+    task = asyncio.create_task(work(cancel))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=0.25)
+        if done:
+            return task.result()
+
+        if await request.is_disconnected():
+            reason, status = "disconnected", 499
+        elif slot and await _db(_store.latest_request, slot) != request_key:
+            reason, status = "superseded", 409
+        else:
+            continue
+
+        cancel.set()   # stops the worker thread at its next streamed chunk
+        task.cancel()  # or drops the call from the scheduler queue if not started
+        _abandoned[reason] += 1
+        logger.info("request %s; aborting upstream call (slot=%s)", reason, slot)
+        raise HTTPException(status_code=status, detail=f"Request {reason}")
+
+
+async def _cached_or_generate(key: str, generate, similar=None) -> tuple[str, str]:
+    """
+    Return the shared cached answer for key, or generate it exactly once across
+    all workers: whoever claims the key generates, everyone else waits for it.
+    On an exact miss, similar() may supply advice cached for a near-identical state.
+    """
+    waited = False
+    while True:
+        cached = await _db(_store.get_response, key)
+        if cached:
+            _cache_stats["hits"] += 1
+            return cached["advice"], cached["model"]
+        if similar and not waited:
+            found = await similar()
+            if found:
+                return found
+        owner = await _db(_store.claim, key)
+        if owner:
+            break
+        # Another request is generating this answer; if it fails, its claim is
+        # released and we take over on the next pass
+        if not waited:
+            _cache_stats["dedup_waits"] += 1
+            waited = True
+        await asyncio.sleep(0.25)
+
+    async def heartbeat() -> None:
+        # Scheduler backoff and retries can outlast the claim timeout; keep it fresh
+        while True:
+            await asyncio.sleep(_store.inflight_timeout / 4)
+            await _db(_store.refresh, key, owner)
+
+    _cache_stats["misses"] += 1
+    beat = asyncio.create_task(heartbeat())
+    try:
+        advice, model = await generate()
+        await _db(_store.put_response, key, advice, model)
+        return advice, model
+    finally:
+        beat.cancel()
+        # Shielded so a cancelled request still hands its claim back
+        await asyncio.shield(_db(_store.release, key, owner))
+
+
+async def _similar_answer(key: str, signature: str, features: dict, audit) -> Optional[tuple[str, str]]:
+    """Advice cached for the nearest state with the same signature, within tolerance."""
+    if SIMILARITY_TOLERANCE <= 0:
+        return None
+    candidates = [c for c in await _db(_store.find_similar, signature) if c["key"] != key]
+    match = nearest(features, candidates)
+    if match is None:
+        return None
+
+    candidate, distance = match
+    _cache_stats["similar_hits"] += 1
+    hit_id = await _db(_store.record_similar_hit, candidate["key"], distance)
+    logger.info("similar-state hit distance=%.2f source=%s", distance, candidate["key"][:12])
+    if random.random() < SIMILARITY_AUDIT_RATE:
+        task = asyncio.create_task(audit(hit_id, candidate["advice"], candidate["model"]))
+        _audit_tasks.add(task)
+        task.add_done_callback(_audit_tasks.discard)
+    return candidate["advice"], candidate["model"]
+
+
+async def _coach(
+    request: Request,
+    kind: str,
+    user_message: str,
+    state_dict: dict,
+    model: str,
+    priority: str,
+    session_id: Optional[str],
+) -> CoachResponse:
+    if session_id:
+        await _db(_store.put_session, session_id, state_dict)
+
+    # "suggest" or "evaluate"; kind also carries the proposed move
+    request_type = kind.partition(":")[0]
+    system_prompt = fit_system_prompt(request_type, user_message)
+    key = answer_cache_key(system_prompt, user_message, model)
+    signature = state_signature(state_dict, kind, model)
+    features = state_features(state_dict)
+
+    async def audit(hit_id: int, reused_advice: str, reused_model: str) -> None:
+        # Answer the state for real at background priority with the model that
+        # wrote the reused advice, so only the state difference is measured
+        try:
+            fresh, fresh_model = await _ask_claude(
+                system_prompt, user_message, state_dict, reused_model, request_type, BACKGROUND, None,
+            )
+        except Exception as e:
+            logger.warning("similar-state audit failed: %s", e)
+            return
+        agreed = advice_agrees(reused_advice, fresh, request_type)
+        await _db(_store.set_hit_agreement, hit_id, agreed)
+        await _db(_store.put_response, key, fresh, fresh_model)
+        await _db(_store.put_similar, key, signature, features)
+        logger.info("similar-state audit hit=%d agreed=%s", hit_id, agreed)
+
+    async def work(cancel: threading.Event):
+        async def generate():
+            result = await _ask_claude(
+                system_prompt, user_message, state_dict, model, request_type, PRIORITIES[priority], cancel,
+            )
+            await _db(_store.put_similar, key, signature, features)
+            return result
+        return await _cached_or_generate(
+            key, generate, lambda: _similar_answer(key, signature, features, audit),
+        )
+
+    try:
+        advice, model = await _run_until_abandoned(
+            request, f"{session_id}:coach" if session_id else None, key, work,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _api_error(e)
+    return CoachResponse(advice=advice, model=model)
+
+
 @app.post("/api/suggest-moves", response_model=CoachResponse)
-async def suggest_moves(req: SuggestMovesRequest):
+async def suggest_moves(req: SuggestMovesRequest, request: Request):
     state_dict = req.game_state.model_dump()
     game_state_text = format_game_state(state_dict)
     user_message = build_suggest_prompt(game_state_text)
-    try:
-        advice = call_claude(_system_prompt, user_message, req.model)
-    except ValueError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Claude API error: {str(e)}")
-    return CoachResponse(advice=advice, model=req.model)
+    return await _coach(request, "suggest", user_message, state_dict, req.model, req.priority, req.session_id)
 
 
 @app.post("/api/evaluate-move", response_model=CoachResponse)
-async def evaluate_move(req: EvaluateMoveRequest):
+async def evaluate_move(req: EvaluateMoveRequest, request: Request):
     state_dict = req.game_state.model_dump()
     game_state_text = format_game_state(state_dict)
     user_message = build_evaluate_prompt(game_state_text, req.proposed_move)
-    try:
-        advice = call_claude(_system_prompt, user_message, req.model)
-    except ValueError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Claude API error: {str(e)}")
-    return CoachResponse(advice=advice, model=req.model)
+    return await _coach(request, f"evaluate:{req.proposed_move}", user_message, state_dict, req.model, req.priority, req.session_id)
 
 
 @app.post("/api/parse-screenshot", response_model=ParseScreenshotResponse)
-async def parse_screenshot(req: ParseScreenshotRequest):
-    prompt_file = PROMPTS_DIR / "parse_screenshot.md"
+async def parse_screenshot(req: ParseScreenshotRequest, request: Request):
+    prompt_name = SCREENSHOT_PROMPTS[req.kind]
+    prompt_file = PROMPTS_DIR / prompt_name
     if not prompt_file.exists():
-        raise HTTPException(status_code=500, detail="parse_screenshot.md prompt not found")
+        raise HTTPException(status_code=500, detail=f"{prompt_name} prompt not found")
     vision_prompt = prompt_file.read_text(encoding="utf-8")
 
     api_key = os.environ.get("ANTHROPIC_API_KEY")
     if not api_key:
         raise HTTPException(status_code=500, detail="ANTHROPIC_API_KEY not set")
 
-    client = anthropic.Anthropic(api_key=api_key)
+    request_type = f"parse_{req.kind}"
+    max_tokens = OUTPUT_BUDGETS[request_type]
+    messages = [{
+        "role": "user",
+        "content": [
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": req.media_type,
+                    "data": req.image_base64,
+                },
+            },
+            {"type": "text", "text": vision_prompt},
+        ],
+    }]
+
+    def create_message(cancel: threading.Event) -> str:
+        return create_message_text(
+            cancel,
+            request_type,
+            model="claude-sonnet-4-6",
+            max_tokens=max_tokens,
+            messages=messages,
+        )
+
+    est_tokens = estimate_input_tokens("", messages) + max_tokens
+    image_key = hashlib.sha256(req.image_base64.encode("ascii", "ignore")).hexdigest()
+
+    async def work(cancel: threading.Event) -> str:
+        return await _scheduler.run(
+            create_message, cancel, priority=PRIORITIES[req.priority], est_tokens=est_tokens,
+        )
 
     try:
-        message = client.messages.create(
-            model="claude-sonnet-4-6",
-            max_tokens=2000,
-            messages=[{
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": req.media_type,
-                            "data": req.image_base64,
-                        },
-                    },
-                    {"type": "text", "text": vision_prompt},
-                ],
-            }],
+        raw = await _run_until_abandoned(
+            request, f"{req.session_id}:screenshot" if req.session_id else None, image_key, work,
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Claude API error: {str(e)}")
+        raise _api_error(e)
 
-    raw = message.content[0].text.strip()
+    raw = raw.strip()
 
     # Strip markdown fences if Claude wrapped the JSON anyway
     if raw.startswith("```"):
@@ -215,6 +508,9 @@ async def parse_screenshot(req: ParseScreenshotRequest):
             detail=f"Could not parse Claude response as JSON: {str(e)}. Raw (first 300 chars): {raw[:300]}"
         )
 
+    if req.kind == "progression_graph":
+        notes = parsed.pop("notes", "Progression graph extracted from screenshot.")
+        return ParseScreenshotResponse(progression_graph=ProgressionGraph(**parsed), notes=notes)
     game_state = parsed.get("game_state", parsed)
     notes = parsed.get("notes", "Game state extracted from screenshot.")
     return ParseScreenshotResponse(game_state=game_state, notes=notes)
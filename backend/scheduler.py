@@ -0,0 +1,205 @@
+"""
+Priority-aware scheduling for Claude API calls.
+
+Interactive requests (a player mid-turn) and background jobs (post-game
+analysis, scenario re-scoring) share the same rate limits. Every call waits
+here for a slot: interactive work is always dispatched before background work,
+a token bucket keeps us under the requests- and tokens-per-minute limits, and
+a 429 from the API pauses dispatch with exponential backoff.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Callable
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+logger = logging.getLogger("coach.scheduler")
+
+
+class TokenBucket:
+    """Refills continuously up to `per_minute`; take() may only follow a zero wait_time()."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (amounts above capacity wait for a full bucket)."""
+        self._refill()
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Scheduler:
+    """Dispatches blocking API calls to worker threads in priority order."""
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrent: int,
+        max_retries: int = 2,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+
+        self._queue = []  # heap of (priority, seq, est_tokens, future)
+        self._seq = itertools.count()
+        self._running = 0
+        self._wakeup = asyncio.Event()
+        self._pump_task = None
+
+        self._consecutive_429s = 0
+        self._backoff_until = 0.0
+
+        self._dispatched = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._wait_total = {INTERACTIVE: 0.0, BACKGROUND: 0.0}
+        self._rate_limited = 0
+
+    async def run(self, fn: Callable, *args, priority: int = INTERACTIVE, est_tokens: int = 0):
+        """Wait for a slot, then run fn(*args) in a worker thread and return its result."""
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, est_tokens)
+            # Cancelling the caller cannot stop the worker thread, so the slot
+            # is freed when the thread returns rather than when we stop waiting
+            work = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+            work.add_done_callback(self._release)
+            try:
+                result = await asyncio.shield(work)
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    self._on_rate_limit(e)
+                    if attempt < self.max_retries:
+                        continue
+                raise
+            else:
+                self._consecutive_429s = 0
+                return result
+
+    def _release(self, work: asyncio.Future) -> None:
+        self._running -= 1
+        self._wakeup.set()
+        if not work.cancelled():
+            work.exception()  # nobody awaits an abandoned call's error
+
+    async def _acquire(self, priority: int, est_tokens: int) -> None:
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), est_tokens, future))
+        self._wakeup.set()
+
+        queued_at = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The pump skips cancelled futures; if we were granted a slot just
+            # before being cancelled, give it back.
+            if future.done() and not future.cancelled():
+                self._running -= 1
+                self._wakeup.set()
+            raise
+        self._wait_total[priority] += time.monotonic() - queued_at
+
+    async def _pump(self) -> None:
+        while True:
+            while self._queue and self._queue[0][3].cancelled():
+                heapq.heappop(self._queue)
+
+            if not self._queue or self._running >= self.max_concurrent:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            priority, _, est_tokens, future = self._queue[0]
+            wait = max(
+                self._backoff_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(est_tokens),
+            )
+            if wait > 0:
+                # Re-check early if something new (possibly higher priority) arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(est_tokens)
+            self._running += 1
+            self._dispatched[priority] += 1
+            future.set_result(None)
+
+    def _on_rate_limit(self, error: Exception) -> None:
+        self._rate_limited += 1
+        self._consecutive_429s += 1
+        delay = max(_retry_after(error), min(60.0, 2.0 ** self._consecutive_429s))
+        self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+        logger.warning("scheduler 429 received; pausing dispatch for %.1fs", delay)
+
+    def stats(self) -> dict:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._queue:
+            if not future.cancelled():
+                depth[PRIORITY_NAMES[priority]] += 1
+
+        return {
+            "queue_depth": depth,
+            "running": self._running,
+            "max_concurrent": self.max_concurrent,
+            "dispatched": {PRIORITY_NAMES[p]: n for p, n in self._dispatched.items()},
+            "avg_wait_s": {
+                PRIORITY_NAMES[p]: (self._wait_total[p] / n if n else None)
+                for p, n in self._dispatched.items()
+            },
+            "rate_limited": self._rate_limited,
+            "backoff_remaining_s": max(0.0, self._backoff_until - time.monotonic()),
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level),
+        }
+
+
+def scheduler_from_env() -> Scheduler:
+    # Each uvicorn worker has its own scheduler, so split the account limits
+    workers = max(1, int(os.environ.get("COACH_WORKERS", "1")))
+    return Scheduler(
+        requests_per_minute=float(os.environ.get("COACH_REQUESTS_PER_MINUTE", "50")) / workers,
+        tokens_per_minute=float(os.environ.get("COACH_TOKENS_PER_MINUTE", "80000")) / workers,
+        max_concurrent=max(1, int(os.environ.get("COACH_MAX_CONCURRENT", "4")) // workers),
+    )
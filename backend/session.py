@@ -0,0 +1,196 @@
+"""
+Interactive coaching session — a game state edited with short commands.
+
+Used by the CLI's interactive mode and by the coaching daemon, so the client,
+system prompt and game state stay warm between turns.
+"""
+import copy
+import json
+from pathlib import Path
+from typing import Iterator
+
+import coach
+
+EMPTY_STATE = {
+    "meta": {"age": 1, "round": 1, "player_count": 4},
+    "player": {
+        "civil_actions": 4,
+        "military_actions": 2,
+        "food_production": 2,
+        "ore_production": 2,
+        "science_production": 1,
+        "culture_production": 0,
+        "military_strength": 1,
+        "culture_points": 0,
+        "leader": None,
+        "wonders_complete": [],
+        "wonders_in_progress": [],
+        "technologies": [],
+        "hand_cards": [],
+    },
+    "opponents": [
+        {"id": f"opponent_{i}", "military_strength": 1,
+         "culture_production_estimate": 0, "culture_points_estimate": 0}
+        for i in range(1, 4)
+    ],
+    "card_row": {"age_1_cards": [], "age_2_cards": [], "age_3_cards": []},
+    "events": {"next_visible": None},
+}
+
+# Short command name -> (section, field)
+NUMBER_FIELDS = {
+    "age": ("meta", "age"),
+    "round": ("meta", "round"),
+    "players": ("meta", "player_count"),
+    "ca": ("player", "civil_actions"),
+    "ma": ("player", "military_actions"),
+    "food": ("player", "food_production"),
+    "ore": ("player", "ore_production"),
+    "sci": ("player", "science_production"),
+    "science": ("player", "science_production"),
+    "cult": ("player", "culture_production"),
+    "culture": ("player", "culture_production"),
+    "mil": ("player", "military_strength"),
+    "pts": ("player", "culture_points"),
+}
+
+LIST_FIELDS = {
+    "hand": "hand_cards",
+    "tech": "technologies",
+    "wonder": "wonders_complete",
+    "building": "wonders_in_progress",
+}
+
+OPPONENT_FIELDS = {
+    "mil": "military_strength",
+    "cult": "culture_production_estimate",
+    "pts": "culture_points_estimate",
+}
+
+HELP = """Commands:
+  ca 6 | ma 3 | food 8 | ore 6 | sci 4 | cult 7 | mil 12 | pts 34 | age 2 | round 4
+  o1 mil 14 | o2 cult 7 | o3 pts 20      (opponent 1-3; "o1 14" sets military)
+  row + Tactics | row - Tactics          (card row, current age)
+  hand + Drama | tech + Chivalry | wonder + Pyramids | building + Colossus
+  leader Caesar | event Military Dominance
+  s | suggest                            (stream top 3 moves)
+  e <move> | eval <move>                 (stream an evaluation of a move)
+  show | load <file> | save <file> | model <name|auto> | help | quit"""
+
+
+class SessionError(ValueError):
+    """A command could not be understood or applied."""
+
+
+class CoachSession:
+    """A game state plus the warm system prompt it is coached against."""
+
+    def __init__(self, state: dict = None, model: str = coach.AUTO_MODEL, include_strategy: bool = True):
+        self.state = copy.deepcopy(state or EMPTY_STATE)
+        self.model = model
+        self.include_strategy = include_strategy
+        # Build the system prompt variants now rather than on the first command
+        coach.fit_system_prompt("suggest", "", include_strategy)
+
+    def handle(self, line: str) -> Iterator[str]:
+        """Run one command and yield its output (streamed for coaching commands)."""
+        words = line.strip().split()
+        if not words:
+            return
+        cmd, rest = words[0].lower(), line.strip()[len(words[0]):].strip()
+
+        try:
+            if cmd in ("s", "suggest"):
+                yield from self._advise("suggest", coach.build_suggest_prompt(coach.format_game_state(self.state)))
+            elif cmd in ("e", "eval"):
+                if not rest:
+                    raise SessionError("Usage: eval <move>")
+                yield from self._advise("evaluate", coach.build_evaluate_prompt(coach.format_game_state(self.state), rest))
+            elif cmd == "show":
+                yield coach.format_game_state(self.state) + "\n"
+                summary = coach.compute_military_summary(self.state)
+                if summary:
+                    yield f"\n{summary}\n"
+            elif cmd == "help":
+                yield HELP + "\n"
+            elif cmd == "load":
+                self.state = json.loads(Path(rest).read_text(encoding="utf-8"))
+                yield f"Loaded {rest}\n"
+            elif cmd == "save":
+                Path(rest).write_text(json.dumps(self.state, indent=2), encoding="utf-8")
+                yield f"Saved {rest}\n"
+            elif cmd == "model":
+                self.model = rest or coach.AUTO_MODEL
+                yield f"Model: {self.model}\n"
+            else:
+                yield self.apply_edit(cmd, rest) + "\n"
+        except (OSError, ValueError) as e:
+            yield f"ERROR: {e}\n"
+
+    def apply_edit(self, cmd: str, rest: str) -> str:
+        """Apply a state-editing command and return a one-line confirmation."""
+        if cmd in NUMBER_FIELDS:
+            section, field = NUMBER_FIELDS[cmd]
+            self.state.setdefault(section, {})[field] = _parse_int(rest)
+            return f"{field} = {self.state[section][field]}"
+
+        if cmd in ("o1", "o2", "o3"):
+            opponents = self.state.setdefault("opponents", [])
+            index = int(cmd[1]) - 1
+            while len(opponents) <= index:
+                opponents.append({"id": f"opponent_{len(opponents) + 1}", "military_strength": 0})
+            parts = rest.split()
+            field = OPPONENT_FIELDS.get(parts[0]) if len(parts) == 2 else "military_strength"
+            if field is None:
+                raise SessionError(f"Unknown opponent field: {parts[0]}")
+            opponents[index][field] = _parse_int(parts[-1] if parts else "")
+            return f"opponent {index + 1} {field} = {opponents[index][field]}"
+
+        if cmd == "row":
+            age = self.state.get("meta", {}).get("age", 1)
+            cards = self.state.setdefault("card_row", {}).setdefault(f"age_{age}_cards", [])
+            return _edit_list(cards, rest, cmd, "card row")
+
+        if cmd in LIST_FIELDS:
+            cards = self.state.setdefault("player", {}).setdefault(LIST_FIELDS[cmd], [])
+            return _edit_list(cards, rest, cmd, LIST_FIELDS[cmd])
+
+        if cmd == "leader":
+            self.state.setdefault("player", {})["leader"] = rest or None
+            return f"leader = {rest or 'none'}"
+
+        if cmd == "event":
+            self.state.setdefault("events", {})["next_visible"] = rest or None
+            return f"next event = {rest or 'none'}"
+
+        raise SessionError(f"Unknown command: {cmd} (type 'help')")
+
+    def _advise(self, request_type: str, user_message: str) -> Iterator[str]:
+        system_prompt = coach.fit_system_prompt(request_type, user_message, self.include_strategy)
+        if self.model == coach.AUTO_MODEL:
+            yield from coach.stream_routed(system_prompt, user_message, self.state, request_type)
+        else:
+            yield from coach.stream_claude(system_prompt, user_message, self.model, request_type)
+        yield "\n"
+
+
+def _parse_int(text: str) -> int:
+    try:
+        return int(text)
+    except ValueError:
+        raise SessionError(f"Expected a number, got {text!r}")
+
+
+def _edit_list(cards: list, rest: str, cmd: str, label: str) -> str:
+    op, _, name = rest.partition(" ")
+    name = name.strip()
+    if op not in ("+", "-") or not name:
+        raise SessionError(f"Usage: {cmd} + <card> | {cmd} - <card>")
+    if op == "+":
+        if name not in cards:
+            cards.append(name)
+    elif name in cards:
+        cards.remove(name)
+    else:
+        raise SessionError(f"{name} is not in {label}")
+    return f"{label}: {', '.join(cards) or '(empty)'}"
@@ -0,0 +1,157 @@
+"""
+Near-duplicate game state matching for the answer cache.
+
+A GameState is split into two parts:
+
+- a signature of the decision-relevant features, which must match exactly:
+  age, the card row, hand, leader, next event, proposed move, and the civil
+  action / military action / science / culture values bucketed at the
+  thresholds in the strategy YAML, plus the military gap bucketed at the
+  hair's-breadth threshold;
+- a numeric feature vector for everything else (culture points, production,
+  round, opponent estimates), compared with a scaled max-norm distance.
+
+Cached advice is reused for a state whose signature matches and whose vector
+is within the tolerance of a previously answered state.
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+
+import coach
+
+SIMILARITY_TOLERANCE = float(os.environ.get("COACH_SIMILARITY_TOLERANCE", "1.0"))
+
+# Feature name -> scale; at tolerance 1.0 a state may differ by at most one
+# scale unit in every feature (e.g. 5 culture points, 1 food per turn)
+NUMERIC_SCALES = {
+    "round": 1,
+    "culture_points": 5,
+    "food_production": 1,
+    "ore_production": 1,
+    "science_production": 1,
+    "culture_production": 1,
+    "military_strength": 1,
+    "opp_culture_production_max": 1,
+    "opp_culture_points_max": 5,
+}
+
+
+def _bucket(value, edges: list) -> Optional[int]:
+    """Index of the bin `value` falls in: 0 below edges[0], len(edges) at or above the last."""
+    if not isinstance(value, (int, float)):
+        return None
+    return sum(1 for edge in edges if value >= edge)
+
+
+def _military_gap(state: dict) -> Optional[int]:
+    player_mil = state.get("player", {}).get("military_strength")
+    opp = [
+        o.get("military_strength")
+        for o in state.get("opponents", [])
+        if isinstance(o.get("military_strength"), (int, float))
+    ]
+    if not isinstance(player_mil, (int, float)) or not opp:
+        return None
+    return max(opp) - player_mil
+
+
+def state_signature(state: dict, kind: str, model: str) -> str:
+    """Hash of the features that must match exactly for advice to be reused."""
+    thresholds = coach.strategy_thresholds()
+    max_gap = thresholds["max_gap"]
+    player = state.get("player", {})
+    card_row = state.get("card_row", {})
+
+    decisive = {
+        "kind": kind.strip().lower(),
+        "model": model,
+        "age": state.get("meta", {}).get("age"),
+        "players": state.get("meta", {}).get("player_count"),
+        "ca": _bucket(player.get("civil_actions"), [thresholds["early_civil_actions"], thresholds["civil_actions"]]),
+        "ma": _bucket(player.get("military_actions"), [thresholds["military_actions"]]),
+        "science": _bucket(player.get("science_production"), [thresholds["science"]]),
+        "culture": _bucket(player.get("culture_production"), [thresholds["culture"]]),
+        # gap <= 0 (leading), within the threshold, up to twice it, beyond
+        "gap": _bucket(_military_gap(state), [1, max_gap + 1, 2 * max_gap + 1]),
+        "row": sorted(c for key in ("age_1_cards", "age_2_cards", "age_3_cards") for c in card_row.get(key, [])),
+        "hand": sorted(player.get("hand_cards", [])),
+        "technologies": sorted(player.get("technologies", [])),
+        "wonders_complete": sorted(player.get("wonders_complete", [])),
+        "wonders_in_progress": sorted(player.get("wonders_in_progress", [])),
+        "leader": player.get("leader"),
+        "event": state.get("events", {}).get("next_visible"),
+    }
+    return hashlib.sha256(json.dumps(decisive, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def state_features(state: dict) -> dict:
+    player = state.get("player", {})
+    opponents = state.get("opponents", [])
+
+    def opp_max(field: str):
+        values = [o.get(field) for o in opponents if isinstance(o.get(field), (int, float))]
+        return max(values) if values else 0
+
+    return {
+        "round": state.get("meta", {}).get("round", 0),
+        "culture_points": player.get("culture_points", 0),
+        "food_production": player.get("food_production", 0),
+        "ore_production": player.get("ore_production", 0),
+        "science_production": player.get("science_production", 0),
+        "culture_production": player.get("culture_production", 0),
+        "military_strength": player.get("military_strength", 0),
+        "opp_culture_production_max": opp_max("culture_production_estimate"),
+        "opp_culture_points_max": opp_max("culture_points_estimate"),
+    }
+
+
+def feature_distance(a: dict, b: dict) -> float:
+    """Scaled max-norm distance between two feature dicts."""
+    return max(
+        abs((a.get(name) or 0) - (b.get(name) or 0)) / scale
+        for name, scale in NUMERIC_SCALES.items()
+    )
+
+
+def nearest(features: dict, candidates: list, tolerance: float = None) -> Optional[tuple[dict, float]]:
+    """Closest candidate (dicts with a "features" key) within tolerance, with its distance."""
+    tolerance = SIMILARITY_TOLERANCE if tolerance is None else tolerance
+    best, best_distance = None, None
+    for candidate in candidates:
+        distance = feature_distance(features, candidate["features"])
+        if best_distance is None or distance < best_distance:
+            best, best_distance = candidate, distance
+    if best is None or best_distance > tolerance:
+        return None
+    return best, best_distance
+
+
+# ── Hit Auditing ───────────────────────────────────────────────────────────────
+
+def _score(advice: str) -> Optional[int]:
+    # The "SCORE: X/10" line the evaluate format asks for, else the first X/10
+    match = (re.search(r"SCORE:\W*(\d{1,2})\s*/\s*10\b", advice, re.IGNORECASE)
+             or re.search(r"\b(\d{1,2})\s*/\s*10\b", advice))
+    return int(match.group(1)) if match else None
+
+
+def _top_move_words(advice: str) -> set:
+    match = re.search(r"^\W*1[.)]\s*(.+)$", advice, re.MULTILINE)
+    line = match.group(1) if match else advice[:120]
+    return set(re.findall(r"[a-z']{3,}", line.lower()))
+
+
+def advice_agrees(cached: str, fresh: str, request_type: str = "suggest") -> bool:
+    """
+    Rough check that reused advice says what a fresh answer would: evaluations
+    must score the move within a point, suggestions must rank the same top move.
+    """
+    if request_type == "evaluate":
+        cached_score, fresh_score = _score(cached), _score(fresh)
+        if cached_score is not None and fresh_score is not None:
+            return abs(cached_score - fresh_score) <= 1
+    a, b = _top_move_words(cached), _top_move_words(fresh)
+    return bool(a | b) and len(a & b) / len(a | b) >= 0.5
@@ -0,0 +1,205 @@
+"""
+Shared local store for cached answers, sessions and in-flight deduplication.
+
+Backed by SQLite in WAL mode so several uvicorn workers (and the CLI) on the
+same machine see one cache: each answer is paid for once, and a request that
+is already being generated by another worker is waited on instead of repeated.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_PATH = Path(__file__).parent.parent / ".cache" / "coach.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key     TEXT PRIMARY KEY,
+    advice  TEXT NOT NULL,
+    model   TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inflight (
+    key     TEXT PRIMARY KEY,
+    owner   TEXT NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    state      TEXT NOT NULL,
+    updated    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS similar_responses (
+    key       TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    features  TEXT NOT NULL,
+    created   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS similar_by_signature ON similar_responses (signature, created);
+CREATE TABLE IF NOT EXISTS similar_hits (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_key TEXT NOT NULL,
+    distance   REAL NOT NULL,
+    agreed     INTEGER,
+    created    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS latest_requests (
+    slot        TEXT PRIMARY KEY,
+    request_key TEXT NOT NULL,
+    updated     REAL NOT NULL
+);
+"""
+
+
+class Store:
+    """One SQLite connection per process, shared by its threads under a lock."""
+
+    def __init__(self, path=None, ttl_seconds: float = None, inflight_timeout: float = 180.0):
+        self.path = Path(path or os.environ.get("COACH_STORE_PATH", DEFAULT_PATH))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.environ.get("COACH_CACHE_TTL", str(24 * 3600))
+        )
+        self.inflight_timeout = inflight_timeout
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        # Rows are read while holding the lock; the connection is shared by threads
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # ── Responses ──────────────────────────────────────────────────────────────
+
+    def get_response(self, key: str) -> Optional[dict]:
+        row = self._fetchone(
+            "SELECT advice, model FROM responses WHERE key = ? AND created > ?",
+            (key, time.time() - self.ttl_seconds),
+        )
+        return {"advice": row[0], "model": row[1]} if row else None
+
+    def put_response(self, key: str, advice: str, model: str) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO responses (key, advice, model, created) VALUES (?, ?, ?, ?)",
+            (key, advice, model, time.time()),
+        )
+
+    # ── Similar states ─────────────────────────────────────────────────────────
+
+    def put_similar(self, key: str, signature: str, features: dict) -> None:
+        """Index an answered state (its answer lives in responses under key)."""
+        self._execute(
+            "INSERT OR REPLACE INTO similar_responses (key, signature, features, created) VALUES (?, ?, ?, ?)",
+            (key, signature, json.dumps(features), time.time()),
+        )
+
+    def find_similar(self, signature: str) -> list:
+        """Answered states with this signature: [{"key", "features", "advice", "model"}]."""
+        rows = self._fetchall(
+            "SELECT s.key, s.features, r.advice, r.model FROM similar_responses s "
+            "JOIN responses r ON r.key = s.key "
+            "WHERE s.signature = ? AND r.created > ?",
+            (signature, time.time() - self.ttl_seconds),
+        )
+        return [
+            {"key": key, "features": json.loads(features), "advice": advice, "model": model}
+            for key, features, advice, model in rows
+        ]
+
+    def record_similar_hit(self, source_key: str, distance: float) -> int:
+        cursor = self._execute(
+            "INSERT INTO similar_hits (source_key, distance, created) VALUES (?, ?, ?)",
+            (source_key, distance, time.time()),
+        )
+        return cursor.lastrowid
+
+    def set_hit_agreement(self, hit_id: int, agreed: bool) -> None:
+        self._execute("UPDATE similar_hits SET agreed = ? WHERE id = ?", (int(agreed), hit_id))
+
+    def similar_hit_stats(self) -> dict:
+        hits, audited, agreed = self._fetchone(
+            "SELECT COUNT(*), COUNT(agreed), COALESCE(SUM(agreed), 0) FROM similar_hits"
+        )
+        return {
+            "hits": hits,
+            "audited": audited,
+            "accuracy": agreed / audited if audited else None,
+        }
+
+    # ── In-flight deduplication ───────────────────────────────────────────────
+
+    def claim(self, key: str) -> Optional[str]:
+        """
+        Mark key as being generated by this request. Returns the owner token to
+        refresh and release the claim with, or None if someone else holds it.
+        """
+        now = time.time()
+        # Claims not refreshed within the timeout belong to a crashed or stuck worker
+        self._execute(
+            "DELETE FROM inflight WHERE key = ? AND started < ?",
+            (key, now - self.inflight_timeout),
+        )
+        # Unique per request, not just per process: a worker may be generating
+        # the same key again after its earlier claim expired
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        cursor = self._execute(
+            "INSERT OR IGNORE INTO inflight (key, owner, started) VALUES (?, ?, ?)",
+            (key, owner, now),
+        )
+        return owner if cursor.rowcount == 1 else None
+
+    def refresh(self, key: str, owner: str) -> None:
+        """Heartbeat from the claim's owner so a long generation is not taken for a stale one."""
+        self._execute(
+            "UPDATE inflight SET started = ? WHERE key = ? AND owner = ?",
+            (time.time(), key, owner),
+        )
+
+    def release(self, key: str, owner: str) -> None:
+        """Drop the claim, unless it expired and was taken over by someone else."""
+        self._execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+    # ── Sessions ───────────────────────────────────────────────────────────────
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        row = self._fetchone("SELECT state FROM sessions WHERE session_id = ?", (session_id,))
+        return json.loads(row[0]) if row else None
+
+    def put_session(self, session_id: str, state: dict) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO sessions (session_id, state, updated) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state), time.time()),
+        )
+
+    def set_latest_request(self, slot: str, request_key: str) -> None:
+        """Record the newest request in a session slot; older ones are superseded."""
+        self._execute(
+            "INSERT OR REPLACE INTO latest_requests (slot, request_key, updated) VALUES (?, ?, ?)",
+            (slot, request_key, time.time()),
+        )
+
+    def latest_request(self, slot: str) -> Optional[str]:
+        row = self._fetchone("SELECT request_key FROM latest_requests WHERE slot = ?", (slot,))
+        return row[0] if row else None
+
+    def stats(self) -> dict:
+        counts = {}
+        for table in ("responses", "similar_responses", "inflight", "sessions"):
+            counts[table] = self._fetchone(f"SELECT COUNT(*) FROM {table}")[0]
+        return {"path": str(self.path), **counts}
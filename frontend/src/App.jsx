@@ -126,6 +126,10 @@ const toApiGameState = (f) => ({
   events: { next_visible: f.next_event || null },
 })
 
+// One session per browser tab, so the backend can track this player's game
+const SESSION_ID = sessionStorage.getItem('ttaSessionId') || crypto.randomUUID()
+sessionStorage.setItem('ttaSessionId', SESSION_ID)
+
 /** Compute live military status for the UI warning banner */
 const getMilStatus = (form) => {
   const myMil = form.military_strength
@@ -147,6 +151,7 @@ export default function App() {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
   const [lastAction, setLastAction] = useState('')
+  const [modelUsed, setModelUsed] = useState('auto')
 
   // Screenshot state
   const [screenshot, setScreenshot] = useState(null)   // data URL for preview
@@ -154,6 +159,10 @@ export default function App() {
   const [parseNotes, setParseNotes] = useState('')
   const [parseError, setParseError] = useState('')
   const fileInputRef = useRef(null)
+  // In-flight requests; aborting one closes its connection so the backend
+  // stops the upstream Claude call instead of finishing a discarded answer
+  const coachAbortRef = useRef(null)
+  const parseAbortRef = useRef(null)
 
   const set = useCallback((key, value) =>
     setForm(prev => ({ ...prev, [key]: value })), [])
@@ -167,6 +176,9 @@ export default function App() {
   }
 
   const callApi = async (endpoint, body) => {
+    coachAbortRef.current?.abort()
+    const controller = new AbortController()
+    coachAbortRef.current = controller
     setLoading(true)
     setError('')
     setResponse('')
@@ -174,7 +186,8 @@ export default function App() {
       const res = await fetch(endpoint, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(body),
+        body: JSON.stringify({ ...body, session_id: SESSION_ID }),
+        signal: controller.signal,
       })
       if (!res.ok) {
         const err = await res.json().catch(() => ({ detail: res.statusText }))
@@ -182,10 +195,12 @@ export default function App() {
       }
       const data = await res.json()
       setResponse(data.advice)
+      setModelUsed(data.model)
     } catch (e) {
+      if (e.name === 'AbortError') return   // superseded by a newer request
       setError(e.message)
     } finally {
-      setLoading(false)
+      if (coachAbortRef.current === controller) setLoading(false)
     }
   }
 
@@ -252,11 +267,15 @@ export default function App() {
     setParseError('')
     const [, base64] = dataUrl.split(',')
     const mediaType = 'image/jpeg'   // resizeImage always produces JPEG
+    parseAbortRef.current?.abort()
+    const controller = new AbortController()
+    parseAbortRef.current = controller
     try {
       const res = await fetch('/api/parse-screenshot', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ image_base64: base64, media_type: mediaType }),
+        body: JSON.stringify({ image_base64: base64, media_type: mediaType, session_id: SESSION_ID }),
+        signal: controller.signal,
       })
       if (!res.ok) {
         const err = await res.json().catch(() => ({ detail: res.statusText }))
@@ -266,9 +285,10 @@ export default function App() {
       populateFormFromGameState(data.game_state)
       setParseNotes(data.notes || 'Game state loaded from screenshot.')
     } catch (e) {
+      if (e.name === 'AbortError') return   // superseded by a newer screenshot
       setParseError(e.message)
     } finally {
-      setParsing(false)
+      if (parseAbortRef.current === controller) setParsing(false)
     }
   }, [populateFormFromGameState])
 
@@ -337,7 +357,7 @@ export default function App() {
     <div className="app">
       <header className="app-header">
         <h1>Through the Ages — <span>AI Coach</span></h1>
-        <span className="model-badge">claude-sonnet-4-6</span>
+        <span className="model-badge">{modelUsed}</span>
       </header>
 
       <div className="app-body">
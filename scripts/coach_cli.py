@@ -15,6 +15,16 @@ Usage:
   # Use a different Claude model:
   python coach_cli.py --state ../data/example_game_states/age2_normal.json --model claude-opus-4-6
 
+  # Check the state and heuristic read without calling the API:
+  python coach_cli.py --state ../data/example_game_states/age2_normal.json --offline
+
+  # Keep a session open for the whole game ("ca 6", "row + Tactics", "s"):
+  python coach_cli.py --interactive --state ../data/example_game_states/age2_normal.json
+
+  # Or run it as a daemon and send commands from thin clients:
+  python coach_cli.py --serve &
+  python coach_cli.py --connect --cmd "ca 6" --cmd "row + Tactics" --cmd s
+
 Setup:
   pip install -r requirements.txt
   cp ../.env.example ../.env
@@ -23,292 +33,180 @@ Setup:
 
 import json
 import sys
-import os
 import argparse
 from pathlib import Path
-from typing import Optional
 
 # Force UTF-8 output on Windows (handles em-dashes, arrows, etc. in Claude responses)
 if hasattr(sys.stdout, "reconfigure"):
     sys.stdout.reconfigure(encoding="utf-8")
 
-# Load .env file if present (look up the directory tree)
-try:
-    from dotenv import load_dotenv
-    # Search up to 3 levels up for a .env file
-    for parent in [Path(__file__).parent, Path(__file__).parent.parent]:
-        env_file = parent / ".env"
-        if env_file.exists():
-            load_dotenv(env_file)
-            break
-except ImportError:
-    pass  # dotenv optional; user can set env var directly
-
-try:
-    import anthropic
-except ImportError:
-    print("ERROR: 'anthropic' package not installed.")
-    print("Run: pip install -r requirements.txt")
-    sys.exit(1)
-
-try:
-    import yaml
-except ImportError:
-    print("ERROR: 'pyyaml' package not installed.")
-    print("Run: pip install -r requirements.txt")
-    sys.exit(1)
-
 
 # ── Paths ─────────────────────────────────────────────────────────────────────
 
 SCRIPTS_DIR = Path(__file__).parent
 REPO_ROOT = SCRIPTS_DIR.parent
-STRATEGY_DIR = REPO_ROOT / "strategy"
-PROMPTS_DIR = REPO_ROOT / "prompts"
-
-
-# ── Data Loading ───────────────────────────────────────────────────────────────
-
-def load_strategy_context() -> str:
-    """Load all strategy YAML files into a single formatted context block."""
-    if not STRATEGY_DIR.exists():
-        return ""
-
-    parts = []
-    # Consistent ordering: military first (most relevant), then age guide, then others
-    ordered_files = [
-        "military.yaml",
-        "age_guide.yaml",
-        "card_priority.yaml",
-        "leaders.yaml",
-        "wonders.yaml",
-    ]
-
-    for filename in ordered_files:
-        yaml_file = STRATEGY_DIR / filename
-        if yaml_file.exists():
-            with open(yaml_file, encoding="utf-8") as f:
-                content = f.read()
-            title = filename.replace(".yaml", "").replace("_", " ").title()
-            parts.append(f"### {title}\n\n```yaml\n{content}\n```")
-
-    # Pick up any additional YAML files not in the ordered list
-    for yaml_file in sorted(STRATEGY_DIR.glob("*.yaml")):
-        if yaml_file.name not in ordered_files:
-            with open(yaml_file, encoding="utf-8") as f:
-                content = f.read()
-            title = yaml_file.stem.replace("_", " ").title()
-            parts.append(f"### {title}\n\n```yaml\n{content}\n```")
-
-    return "\n\n---\n\n".join(parts)
-
-
-def load_system_prompt() -> str:
-    """Load the main coaching system prompt."""
-    system_file = PROMPTS_DIR / "coach_system.md"
-    if system_file.exists():
-        return system_file.read_text(encoding="utf-8")
-    # Minimal fallback if file is missing
-    return (
-        "You are an expert Through the Ages coach specializing in tournament-level "
-        "adaptive play for 4-player games with military escalation dynamics."
-    )
-
-
-# ── Game State Formatting ──────────────────────────────────────────────────────
-
-def format_game_state(state: dict) -> str:
-    """Convert game state dict to a readable text block for the prompt."""
-    lines = []
-
-    meta = state.get("meta", {})
-    lines.append(
-        f"AGE: {meta.get('age', '?')}  |  "
-        f"ROUND: {meta.get('round', '?')}  |  "
-        f"PLAYERS: {meta.get('player_count', '?')}"
-    )
-
-    player = state.get("player", {})
-    lines.append("\nYOUR CIVILIZATION:")
-    lines.append(
-        f"  Civil Actions: {player.get('civil_actions', '?')}  |  "
-        f"Military Actions: {player.get('military_actions', '?')}"
-    )
-    lines.append(
-        f"  Food Production: {player.get('food_production', '?')}/turn  |  "
-        f"Ore Production: {player.get('ore_production', '?')}/turn"
-    )
-    lines.append(
-        f"  Science: {player.get('science_production', '?')}/turn  |  "
-        f"Culture Production: {player.get('culture_production', '?')}/turn"
-    )
-    lines.append(
-        f"  Military Strength: {player.get('military_strength', '?')}  |  "
-        f"Culture Points: {player.get('culture_points', '?')}"
-    )
-
-    leader = player.get("leader")
-    if leader:
-        lines.append(f"  Leader: {leader}")
-
-    wonders_complete = player.get("wonders_complete", [])
-    if wonders_complete:
-        lines.append(f"  Wonders Complete: {', '.join(wonders_complete)}")
-
-    wonders_in_progress = player.get("wonders_in_progress", [])
-    if wonders_in_progress:
-        lines.append(f"  Wonders In Progress: {', '.join(wonders_in_progress)}")
-
-    technologies = player.get("technologies", [])
-    if technologies:
-        lines.append(f"  Technologies: {', '.join(technologies)}")
-
-    hand_cards = player.get("hand_cards", [])
-    if hand_cards:
-        lines.append(f"  Cards in Hand: {', '.join(hand_cards)}")
-
-    opponents = state.get("opponents", [])
-    if opponents:
-        lines.append("\nOPPONENTS:")
-
-        # Compute military gaps for context
-        player_mil = player.get("military_strength", 0)
-        for i, opp in enumerate(opponents, 1):
-            opp_mil = opp.get("military_strength", "?")
-            gap_str = ""
-            if isinstance(opp_mil, (int, float)) and isinstance(player_mil, (int, float)):
-                gap = opp_mil - player_mil
-                if gap > 0:
-                    gap_str = f"  [GAP: +{gap} vs you]"
-                elif gap < 0:
-                    gap_str = f"  [GAP: {gap} vs you]"
-                else:
-                    gap_str = "  [TIED]"
-
-            opp_line = (
-                f"  Opponent {i}: "
-                f"Military {opp_mil}{gap_str}  |  "
-                f"~{opp.get('culture_production_estimate', '?')} culture/turn  |  "
-                f"~{opp.get('culture_points_estimate', '?')} pts"
-            )
-            note = opp.get("_note") or opp.get("notes")
-            if note:
-                opp_line += f"  [{note}]"
-            lines.append(opp_line)
-
-    card_row = state.get("card_row", {})
-    available_cards = []
-    for age_key in ["age_1_cards", "age_2_cards", "age_3_cards"]:
-        available_cards.extend(card_row.get(age_key, []))
-    if available_cards:
-        lines.append(f"\nCARD ROW: {', '.join(available_cards)}")
-
-    events = state.get("events", {})
-    next_event = events.get("next_visible")
-    if next_event:
-        lines.append(f"\nNEXT EVENT: {next_event}")
-
-    return "\n".join(lines)
-
-
-def compute_military_summary(state: dict) -> Optional[str]:
-    """Generate a quick military situation summary for context."""
-    player = state.get("player", {})
-    opponents = state.get("opponents", [])
-    player_mil = player.get("military_strength")
-
-    if not isinstance(player_mil, (int, float)) or not opponents:
-        return None
-
-    opp_strengths = [
-        o.get("military_strength")
-        for o in opponents
-        if isinstance(o.get("military_strength"), (int, float))
-    ]
-    if not opp_strengths:
-        return None
-
-    max_opp = max(opp_strengths)
-    gap = max_opp - player_mil
-
-    if gap > 2:
-        return f"!! MILITARY WARNING: Gap of {gap} vs strongest opponent (threshold is 2)"
-    elif gap > 0:
-        return f"Military gap: {gap} vs strongest opponent (within safe threshold)"
-    else:
-        return f"Military: you are leading or tied with all opponents"
-
+BACKEND_DIR = REPO_ROOT / "backend"
 
-# ── Prompt Building ────────────────────────────────────────────────────────────
+# The coaching core lives in backend/coach.py and is shared with the web API.
+# It is imported after argument parsing so that --help never pays for it.
+sys.path.insert(0, str(BACKEND_DIR))
 
-def build_suggest_prompt(game_state_text: str) -> str:
-    return f"""Here is the current game state:
 
-{game_state_text}
+# ── Display ────────────────────────────────────────────────────────────────────
 
-Please analyze this game state and suggest the top 3 moves I should consider this turn,
-ranked by strategic priority.
+WIDTH = 60
 
-For each move:
-1. Name the action clearly
-2. Explain why it is the right move given the current numbers
-3. Note any trade-offs or conditions that could change the recommendation
+def divider(char: str = "-") -> str:
+    return char * WIDTH
 
-Then provide one overall strategic insight about my current game state —
-what is my biggest structural advantage or risk right now?"""
+def header(title: str) -> str:
+    pad = (WIDTH - len(title) - 2) // 2
+    return f"\n{'=' * WIDTH}\n{' ' * pad} {title}\n{'=' * WIDTH}"
 
 
-def build_evaluate_prompt(game_state_text: str, proposed_move: str) -> str:
-    return f"""Here is the current game state:
+# ── Interactive Mode & Daemon ──────────────────────────────────────────────────
+#
+# The daemon speaks a line protocol: the client sends one command per line and
+# the server streams the output back, terminated by END_OF_REPLY.
 
-{game_state_text}
+DEFAULT_SOCKET = REPO_ROOT / ".cache" / "coach.sock"
+END_OF_REPLY = "\x00"
 
-PROPOSED MOVE: {proposed_move}
 
-Please evaluate this move with:
-1. A score from 1-10 (10 = perfectly optimal given the situation)
-2. Your assessment: why is this move good or bad given this specific game state?
-3. Specific reasoning referencing actual numbers (military gaps, civil actions,
-   science production, culture rate, etc.)
-4. If the score is below 8: the top 2 alternative moves you would recommend instead
-5. One specific action or situation to watch for next turn"""
+def run_command(coaching, line: str, write) -> None:
+    """
+    Run one session command, passing output chunks to write() as they stream.
+    Ctrl+C stops the command (and its API stream) but keeps the session.
+    """
+    output = coaching.handle(line)
+    try:
+        for chunk in output:
+            write(chunk)
+    except KeyboardInterrupt:
+        write("\n[Stopped]\n")
+    except (BrokenPipeError, ConnectionResetError):
+        raise  # the daemon client is gone; there is nowhere to report it
+    except Exception as e:
+        write(f"ERROR: {e}\n")
+    finally:
+        output.close()  # ends an interrupted stream
+
+
+def run_interactive(coaching) -> None:
+    print(header("Through the Ages - Interactive Coach"))
+    print("Type 'help' for commands, 'show' for the current state, 'quit' to exit.\n")
+
+    def write(chunk: str) -> None:
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
+
+    while True:
+        try:
+            line = input("coach> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if line.strip().lower() in ("q", "quit", "exit"):
+            break
+        run_command(coaching, line, write)
 
 
-# ── API Call ───────────────────────────────────────────────────────────────────
+def serve(coaching, socket_path: str) -> None:
+    import socket
+    import socketserver
+    import threading
 
-def call_claude(system_prompt: str, user_message: str, model: str) -> str:
-    """Call the Claude API and return the text response."""
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        print("\nERROR: ANTHROPIC_API_KEY is not set.")
-        print("Options:")
-        print("  1. Create a .env file in the repo root with: ANTHROPIC_API_KEY=your_key")
-        print("  2. Or export it: export ANTHROPIC_API_KEY=your_key")
-        print("\nGet an API key at: https://console.anthropic.com")
+    if not hasattr(socket, "AF_UNIX"):
+        print("ERROR: Unix sockets are not available on this platform; use --interactive instead.")
         sys.exit(1)
 
-    client = anthropic.Anthropic(api_key=api_key)
-
-    message = client.messages.create(
-        model=model,
-        max_tokens=1500,
-        system=system_prompt,
-        messages=[{"role": "user", "content": user_message}],
-    )
-
-    return message.content[0].text
-
-
-# ── Display ────────────────────────────────────────────────────────────────────
-
-WIDTH = 60
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def write(chunk: str) -> None:
+                self.wfile.write(chunk.encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                for raw in self.rfile:
+                    # One shared game session; commands from different clients take turns
+                    with lock:
+                        run_command(coaching, raw.decode("utf-8"), write)
+                    write(END_OF_REPLY)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client disconnected mid-reply
+
+    path = Path(socket_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        # Only remove a stale socket; a live one belongs to a running daemon
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+        except OSError:
+            path.unlink()
+        else:
+            print(f"ERROR: A coaching daemon is already listening on {path}.")
+            print("Use --connect to talk to it, or --socket to start another one elsewhere.")
+            sys.exit(1)
+        finally:
+            probe.close()
+    with socketserver.ThreadingUnixStreamServer(str(path), Handler) as server:
+        print(f"Coaching daemon listening on {path} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            path.unlink(missing_ok=True)
+
+
+def connect(socket_path: str, commands: list) -> None:
+    import codecs
+    import socket
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("ERROR: Unix sockets are not available on this platform.")
+        sys.exit(1)
 
-def divider(char: str = "-") -> str:
-    return char * WIDTH
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        print(f"ERROR: Could not reach the coaching daemon at {socket_path}: {e}")
+        print("Start it with: python coach_cli.py --serve")
+        sys.exit(1)
 
-def header(title: str) -> str:
-    pad = (WIDTH - len(title) - 2) // 2
-    return f"\n{'=' * WIDTH}\n{' ' * pad} {title}\n{'=' * WIDTH}"
+    def send(line: str) -> None:
+        sock.sendall((line.strip() + "\n").encode("utf-8"))
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                return
+            text = decoder.decode(data)
+            done = text.endswith(END_OF_REPLY)
+            sys.stdout.write(text.rstrip(END_OF_REPLY))
+            sys.stdout.flush()
+            if done:
+                return
+
+    with sock:
+        if commands:
+            for line in commands:
+                send(line)
+            return
+        while True:
+            try:
+                line = input("coach> ")
+            except (EOFError, KeyboardInterrupt):
+                print()
+                break
+            if line.strip().lower() in ("q", "quit", "exit"):
+                break
+            if line.strip():
+                send(line)
 
 
 # ── Main ───────────────────────────────────────────────────────────────────────
@@ -333,8 +231,8 @@ Examples:
     )
     parser.add_argument(
         "--state",
-        required=True,
-        help="Path to game state JSON file",
+        default=None,
+        help="Path to game state JSON file (required except in interactive/daemon modes)",
     )
     parser.add_argument(
         "--move",
@@ -343,51 +241,77 @@ Examples:
     )
     parser.add_argument(
         "--model",
-        default="claude-sonnet-4-6",
-        help="Claude model to use (default: claude-sonnet-4-6)",
+        default="auto",
+        help="Claude model to use (default: auto — easy states try a fast model first)",
     )
     parser.add_argument(
         "--no-strategy",
         action="store_true",
         help="Skip injecting strategy YAML into the prompt (faster, uses less tokens)",
     )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Show the formatted game state and heuristic read without calling Claude",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore previously cached answers for the same state and move",
+    )
+    parser.add_argument(
+        "-i", "--interactive",
+        action="store_true",
+        help="Start a coaching REPL that keeps the game state between turns",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run the coaching session as a background daemon on a local Unix socket",
+    )
+    parser.add_argument(
+        "--connect",
+        action="store_true",
+        help="Send commands to a running daemon (from --cmd, or interactively)",
+    )
+    parser.add_argument(
+        "--cmd",
+        action="append",
+        default=[],
+        help="Command to send with --connect (repeatable), e.g. --cmd \"ca 6\" --cmd s",
+    )
+    parser.add_argument(
+        "--socket",
+        default=str(DEFAULT_SOCKET),
+        help=f"Daemon socket path (default: {DEFAULT_SOCKET})",
+    )
 
     args = parser.parse_args()
 
+    if args.connect:
+        connect(args.socket, args.cmd)
+        return
+
+    if args.state is None and not (args.interactive or args.serve):
+        parser.error("--state is required unless using --interactive, --serve or --connect")
+
+    import coach
+
     # ── Load game state ──────────────────────────────────────────────────────
-    state_path = Path(args.state)
-    if not state_path.exists():
-        # Try resolving relative to script directory
-        state_path = SCRIPTS_DIR / args.state
-    if not state_path.exists():
-        print(f"ERROR: Game state file not found: {args.state}")
-        sys.exit(1)
+    game_state = load_state_file(args.state) if args.state else None
 
-    with open(state_path, encoding="utf-8") as f:
-        game_state = json.load(f)
-
-    # ── Build system prompt ──────────────────────────────────────────────────
-    base_system = load_system_prompt()
-
-    if not args.no_strategy:
-        strategy_context = load_strategy_context()
-        if strategy_context:
-            full_system = (
-                f"{base_system}\n\n"
-                f"---\n\n"
-                f"## Strategy Knowledge Base\n\n"
-                f"Use the following strategy knowledge when evaluating moves. "
-                f"All principles in here represent tournament-level best practices.\n\n"
-                f"{strategy_context}"
-            )
+    if args.interactive or args.serve:
+        import session
+        coaching = session.CoachSession(game_state, args.model, include_strategy=not args.no_strategy)
+        if args.serve:
+            serve(coaching, args.socket)
         else:
-            full_system = base_system
-    else:
-        full_system = base_system
+            run_interactive(coaching)
+        return
 
     # ── Format game state ────────────────────────────────────────────────────
-    game_state_text = format_game_state(game_state)
-    mil_summary = compute_military_summary(game_state)
+    game_state_text = coach.format_game_state(game_state)
+    mil_summary = coach.compute_military_summary(game_state)
 
     # ── Print game state summary ─────────────────────────────────────────────
     print(header("Through the Ages - Coaching System"))
@@ -401,28 +325,38 @@ Examples:
 
     print(f"\n{divider()}")
 
+    if args.offline:
+        reason = coach.classify_state(game_state)
+        print(f"Heuristic read: {reason or 'no obvious move — needs full analysis'}")
+        print(f"\n{'=' * WIDTH}\n")
+        return
+
     # ── Determine mode and build user prompt ─────────────────────────────────
     if args.move:
         mode_label = "MOVE EVALUATION"
-        user_message = build_evaluate_prompt(game_state_text, args.move)
+        request_type = "evaluate"
+        user_message = coach.build_evaluate_prompt(game_state_text, args.move)
         print(f"Evaluating move: {args.move}")
     else:
         mode_label = "COACHING ADVICE"
-        user_message = build_suggest_prompt(game_state_text)
+        request_type = "suggest"
+        user_message = coach.build_suggest_prompt(game_state_text)
         print("Mode: suggest top 3 moves")
 
-    print(f"Model: {args.model}")
-    print(f"\nCalling Claude API...\n")
-
-    # ── Call Claude ──────────────────────────────────────────────────────────
-    try:
-        response = call_claude(full_system, user_message, args.model)
-    except anthropic.APIStatusError as e:
-        print(f"ERROR: Claude API returned status {e.status_code}: {e.message}")
-        sys.exit(1)
-    except anthropic.APIConnectionError:
-        print("ERROR: Could not connect to Claude API. Check your internet connection.")
-        sys.exit(1)
+    # ── Build system prompt (from the precompiled strategy bundle) ───────────
+    full_system = coach.fit_system_prompt(request_type, user_message, include_strategy=not args.no_strategy)
+
+    # Answers are shared with the web backend through the local store
+    from store import Store
+    answers = Store()
+    cache_key = coach.answer_cache_key(full_system, user_message, args.model)
+    cached = None if args.no_cache else answers.get_response(cache_key)
+    if cached:
+        print(f"Model: {cached['model']} (cached answer)")
+        response = cached["advice"]
+    else:
+        response, used_model = ask_claude(coach, full_system, user_message, game_state, args.model, request_type)
+        answers.put_response(cache_key, response, used_model)
 
     # ── Print response ───────────────────────────────────────────────────────
     print(header(mode_label))
@@ -431,5 +365,57 @@ Examples:
     print(f"\n{'=' * WIDTH}\n")
 
 
+def load_state_file(path_arg: str) -> dict:
+    state_path = Path(path_arg)
+    if not state_path.exists():
+        # Try resolving relative to script directory
+        state_path = SCRIPTS_DIR / path_arg
+    if not state_path.exists():
+        print(f"ERROR: Game state file not found: {path_arg}")
+        sys.exit(1)
+
+    with open(state_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ask_claude(
+    coach, full_system: str, user_message: str, game_state: dict, model: str, request_type: str,
+) -> tuple[str, str]:
+    """Call Claude (routed when model is "auto") and return (answer, model used)."""
+    print(f"Model: {model}")
+    print(f"\nCalling Claude API...\n")
+
+    try:
+        if model == coach.AUTO_MODEL:
+            response, used_model = coach.route_claude(full_system, user_message, game_state, request_type=request_type)
+            print(f"Answered by: {used_model}")
+        else:
+            response, used_model = coach.call_claude(
+                full_system, user_message, model, request_type=request_type,
+            ), model
+    except coach.MissingAPIKeyError:
+        print("\nERROR: ANTHROPIC_API_KEY is not set.")
+        print("Options:")
+        print("  1. Create a .env file in the repo root with: ANTHROPIC_API_KEY=your_key")
+        print("  2. Or export it: export ANTHROPIC_API_KEY=your_key")
+        print("\nGet an API key at: https://console.anthropic.com")
+        sys.exit(1)
+    except ImportError:
+        print("ERROR: 'anthropic' package not installed.")
+        print("Run: pip install -r requirements.txt")
+        sys.exit(1)
+    except Exception as e:
+        import anthropic
+        if isinstance(e, anthropic.APIStatusError):
+            print(f"ERROR: Claude API returned status {e.status_code}: {e.message}")
+            sys.exit(1)
+        if isinstance(e, anthropic.APIConnectionError):
+            print("ERROR: Could not connect to Claude API. Check your internet connection.")
+            sys.exit(1)
+        raise
+
+    return response, used_model
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Through the Ages Progression Graph Extractor
+
+Reads screenshots of the Steam version's end-of-game progression graphs
+(food, resources, military, science, culture) and traces each player's line
+into a per-round numeric series — locally, with no model calls.
+
+For each screenshot it detects the plot area from the axis lines, finds the
+player line colors, and follows each color across the plot. Screenshots where
+detection confidence is low can optionally be sent to the backend's
+/api/parse-screenshot endpoint instead.
+
+Usage:
+  # Extract every graph in a folder (category is taken from the file name):
+  python extract_graphs.py ../screenshots/*.png --rounds 20
+
+  # Read the real scale off the y-axis yourself and pass it in:
+  python extract_graphs.py culture.png --y-max 120
+
+  # Fall back to Claude Vision for low-confidence screenshots:
+  python extract_graphs.py ../screenshots/*.png --api http://localhost:8000
+
+Setup:
+  pip install -r requirements.txt
+"""
+
+import argparse
+import base64
+import json
+import sys
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+# Force UTF-8 output on Windows
+if hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding="utf-8")
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: 'numpy' package not installed.")
+    print("Run: pip install -r requirements.txt")
+    sys.exit(1)
+
+try:
+    from PIL import Image
+except ImportError:
+    print("ERROR: 'Pillow' package not installed.")
+    print("Run: pip install -r requirements.txt")
+    sys.exit(1)
+
+
+CATEGORIES = ["food", "resources", "military", "science", "culture"]
+
+# Pixel classification thresholds (0-255 RGB space)
+BACKGROUND_DISTANCE = 40     # farther than this from the background = "ink"
+LINE_SATURATION = 0.35       # player lines are colored; axes and grid are gray
+LINE_MIN_BRIGHTNESS = 80
+COLOR_MATCH_DISTANCE = 60    # pixels this close to a player color belong to it
+AXIS_MIN_FILL = 0.5          # an axis line spans at least half the image
+GRID_MIN_FILL = 0.3          # a gridline spans at least 30% of the plot
+
+# Plot-area confidence when the top of the y scale is unknown; below the
+# default --min-confidence so these go to the vision fallback when enabled
+AXES_ONLY_CONFIDENCE = 0.5
+# Round count assumed when there is no --rounds and no gridlines to count, and
+# the confidence factor applied then: the x positions of every sample are a guess
+DEFAULT_ROUNDS = 20
+GUESSED_ROUNDS_CONFIDENCE = 0.5
+
+
+# ── Image Analysis ─────────────────────────────────────────────────────────────
+
+def _background_color(rgb: np.ndarray) -> np.ndarray:
+    """Most common color, quantized to 16 levels per channel."""
+    quantized = (rgb >> 4).reshape(-1, 3).astype(np.int32)
+    codes = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+    mode = np.bincount(codes).argmax()
+    return np.array([(mode >> 8) & 15, (mode >> 4) & 15, mode & 15]) * 16 + 8
+
+
+def _saturation(rgb: np.ndarray) -> np.ndarray:
+    hi = rgb.max(axis=2).astype(np.float32)
+    lo = rgb.min(axis=2).astype(np.float32)
+    return np.where(hi > 0, (hi - lo) / np.maximum(hi, 1), 0)
+
+
+def _line_positions(fill: np.ndarray, min_fill: float) -> list:
+    """Centers of runs of consecutive rows/columns whose fill ratio exceeds min_fill."""
+    positions = []
+    run = []
+    for i, value in enumerate(fill):
+        if value >= min_fill:
+            run.append(i)
+        elif run:
+            positions.append(run[len(run) // 2])
+            run = []
+    if run:
+        positions.append(run[len(run) // 2])
+    return positions
+
+
+def find_plot_area(rgb: np.ndarray) -> tuple[tuple[int, int, int, int], float, bool]:
+    """
+    Locate the plot rectangle (left, top, right, bottom) from long gray axis
+    lines. Returns the box, a confidence in [0, 1], and whether the top edge
+    is a drawn line (the top of the y scale) rather than the data's peak.
+    """
+    height, width = rgb.shape[:2]
+    background = _background_color(rgb)
+    distance = np.abs(rgb.astype(np.int16) - background).sum(axis=2)
+    gray_ink = (distance > BACKGROUND_DISTANCE) & (_saturation(rgb) < LINE_SATURATION)
+
+    rows = _line_positions(gray_ink.mean(axis=1), AXIS_MIN_FILL)
+    cols = _line_positions(gray_ink.mean(axis=0), AXIS_MIN_FILL)
+
+    if len(rows) >= 2 and len(cols) >= 2:
+        return (cols[0], rows[0], cols[-1], rows[-1]), 1.0, True
+
+    if rows and cols:
+        # Only the x and y axes are drawn: the plot extends up and right of them
+        # to the bounding box of the colored content. The top sits just above
+        # the highest point so the inward crop keeps it.
+        left, bottom = cols[0], rows[-1]
+        colored = _saturation(rgb) >= LINE_SATURATION
+        ys, xs = np.nonzero(colored[:bottom, left + 1:])
+        if len(ys):
+            top = max(0, int(ys.min()) - 2)
+            return (left, top, left + 1 + int(xs.max()), bottom), AXES_ONLY_CONFIDENCE, False
+
+    # No usable axes; treat the whole image as the plot
+    return (0, 0, width - 1, height - 1), 0.3, False
+
+
+def find_line_colors(plot: np.ndarray, max_players: int) -> list:
+    """Return up to max_players distinct saturated colors, most frequent first."""
+    saturated = (_saturation(plot) >= LINE_SATURATION) & (plot.max(axis=2) >= LINE_MIN_BRIGHTNESS)
+    pixels = plot[saturated]
+    if not len(pixels):
+        return []
+
+    quantized = (pixels >> 4).astype(np.int32)
+    codes = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+    counts = np.bincount(codes)
+    min_pixels = max(10, plot.shape[1] // 5)
+
+    colors = []
+    for code in np.argsort(counts)[::-1]:
+        if counts[code] < min_pixels or len(colors) >= max_players:
+            break
+        color = np.array([(code >> 8) & 15, (code >> 4) & 15, code & 15]) * 16 + 8
+        if all(np.abs(color - c).sum() > COLOR_MATCH_DISTANCE for c in colors):
+            colors.append(color)
+    return colors
+
+
+def count_rounds(plot: np.ndarray) -> Optional[int]:
+    """
+    Infer the number of rounds from evenly spaced vertical gridlines, if any.
+    The plot is cropped inside the axes, which mark the first and last rounds.
+    """
+    background = _background_color(plot)
+    distance = np.abs(plot.astype(np.int16) - background).sum(axis=2)
+    grid = (distance > BACKGROUND_DISTANCE // 2) & (_saturation(plot) < LINE_SATURATION)
+    cols = _line_positions(grid.mean(axis=0), GRID_MIN_FILL)
+    if len(cols) < 3:
+        return None
+    gaps = np.diff(cols)
+    if gaps.std() > 0.15 * gaps.mean():
+        return None
+    return len(cols) + 2
+
+
+def trace_series(plot: np.ndarray, color: np.ndarray, samples: int) -> tuple[list, float]:
+    """
+    Follow one colored line across the plot. Returns `samples` values as a
+    fraction of plot height (0 = bottom, 1 = top) and the column coverage.
+    """
+    height, width = plot.shape[:2]
+    match = np.abs(plot.astype(np.int16) - color).sum(axis=2) < COLOR_MATCH_DISTANCE
+
+    ys = np.full(width, np.nan)
+    for x in range(width):
+        hits = np.nonzero(match[:, x])[0]
+        if len(hits):
+            ys[x] = np.median(hits)
+
+    found = ~np.isnan(ys)
+    coverage = float(found.mean())
+    if found.sum() < 2:
+        return [], coverage
+
+    xs = np.arange(width)
+    ys = np.interp(xs, xs[found], ys[found])
+    positions = np.linspace(0, width - 1, samples).round().astype(int)
+    values = 1.0 - ys[positions] / max(height - 1, 1)
+    return [round(float(v), 4) for v in values], coverage
+
+
+def extract_graph(path: str, rounds: Optional[int] = None, y_max: Optional[float] = None, max_players: int = 4) -> dict:
+    """Extract every player's series from one progression graph screenshot."""
+    rgb = np.asarray(Image.open(path).convert("RGB"))
+    (left, top, right, bottom), area_confidence, has_top = find_plot_area(rgb)
+    # Step inside the axes so they are not traced as data
+    plot = rgb[top + 2:bottom - 1, left + 2:right - 1]
+
+    stem = Path(path).stem.lower()
+    category = next((c for c in CATEGORIES if c in stem), "unknown")
+    result = {
+        "category": category,
+        "plot_area": [int(left), int(top), int(right), int(bottom)],
+        "source": "local",
+        "series": {},
+    }
+
+    if plot.size == 0:
+        result.update(confidence=0.0, scale="fraction_of_plot_height")
+        return result
+
+    warnings = []
+    samples = rounds or count_rounds(plot)
+    rounds_confidence = 1.0
+    if samples is None:
+        samples = DEFAULT_ROUNDS
+        rounds_confidence = GUESSED_ROUNDS_CONFIDENCE
+        warnings.append(f"no gridlines to count rounds; assumed {DEFAULT_ROUNDS}, pass --rounds")
+    result["rounds"] = samples
+    result["rounds_inferred"] = rounds_confidence == 1.0
+    # Without a drawn top line, 1.0 is the highest data point, not --y-max
+    scale_to = y_max if has_top else None
+    if y_max is not None and not has_top:
+        warnings.append("top of the y scale not found; --y-max ignored")
+    if warnings:
+        result["warning"] = "; ".join(warnings)
+
+    colors = find_line_colors(plot, max_players)
+    coverages = []
+    for i, color in enumerate(colors, 1):
+        values, coverage = trace_series(plot, color, samples)
+        if scale_to is not None:
+            values = [round(v * scale_to, 2) for v in values]
+        coverages.append(coverage)
+        result["series"][f"player_{i}"] = {
+            "color": "#{:02x}{:02x}{:02x}".format(*(int(c) for c in color)),
+            "values": values,
+            "coverage": round(coverage, 3),
+        }
+
+    # Confidence: plot detection x worst line coverage x plausible player count
+    # x whether the round count was known
+    color_confidence = 1.0 if 2 <= len(colors) <= max_players else 0.5
+    result["confidence"] = round(
+        area_confidence * min(coverages, default=0.0) * color_confidence * rounds_confidence, 3
+    )
+    if scale_to is not None:
+        result["scale"] = "absolute"
+    else:
+        result["scale"] = "fraction_of_plot_height" if has_top else "fraction_of_highest_point"
+    return result
+
+
+# ── Vision Fallback ────────────────────────────────────────────────────────────
+
+def parse_with_api(path: str, api_url: str) -> dict:
+    """Send a screenshot to the backend's /api/parse-screenshot endpoint."""
+    suffix = Path(path).suffix.lower()
+    media_type = "image/jpeg" if suffix in (".jpg", ".jpeg") else "image/png"
+    body = json.dumps({
+        "image_base64": base64.b64encode(Path(path).read_bytes()).decode("ascii"),
+        "media_type": media_type,
+        "kind": "progression_graph",
+        "priority": "background",
+    }).encode("utf-8")
+    request = urllib.request.Request(
+        f"{api_url.rstrip('/')}/api/parse-screenshot",
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        data = json.loads(response.read().decode("utf-8"))
+
+    # Same shape as extract_graph(); values are read off the axis labels
+    graph = data["progression_graph"]
+    return {
+        "category": graph.get("category", "unknown"),
+        "plot_area": None,
+        "source": "vision",
+        "series": {
+            name: {"color": line.get("color"), "values": line.get("values", [])}
+            for name, line in graph.get("series", {}).items()
+        },
+        "rounds": graph.get("rounds"),
+        "confidence": None,
+        "scale": "absolute",
+        "notes": data.get("notes", ""),
+    }
+
+
+# ── Main ───────────────────────────────────────────────────────────────────────
+
+def _extract_one(job: tuple) -> tuple[str, dict]:
+    path, rounds, y_max, max_players = job
+    try:
+        return path, extract_graph(path, rounds, y_max, max_players)
+    except Exception as e:
+        return path, {"error": str(e), "confidence": 0.0, "source": "local"}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract per-round series from Through the Ages progression graph screenshots",
+    )
+    parser.add_argument("images", nargs="+", help="Screenshot files (one graph each)")
+    parser.add_argument("--rounds", type=int, default=None,
+                        help="Number of rounds on the x-axis (default: inferred from gridlines, "
+                             f"else {DEFAULT_ROUNDS} at reduced confidence)")
+    parser.add_argument("--y-max", type=float, default=None,
+                        help="Value at the top of the plot; without it (or if the plot has no top line) "
+                             "values are fractions of plot height")
+    parser.add_argument("--players", type=int, default=4, help="Maximum number of player lines (default: 4)")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel worker processes (default: CPU count)")
+    parser.add_argument("--min-confidence", type=float, default=0.6,
+                        help="Below this, use --api if given (default: 0.6)")
+    parser.add_argument("--api", default=None,
+                        help="Backend URL for the vision fallback, e.g. http://localhost:8000")
+    parser.add_argument("--out", default=None, help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    jobs = [(path, args.rounds, args.y_max, args.players) for path in args.images]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = dict(pool.map(_extract_one, jobs))
+
+    if args.api:
+        for path, result in results.items():
+            if result["confidence"] < args.min_confidence:
+                print(f"Low confidence ({result['confidence']}) for {path}; asking the vision API...",
+                      file=sys.stderr)
+                try:
+                    results[path] = parse_with_api(path, args.api)
+                except Exception as e:
+                    result["fallback_error"] = str(e)
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()